@@ -0,0 +1,742 @@
+#!/usr/bin/env python3
+
+# performance benchmarks for the Day One import utilities
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+
+import logging
+
+from datetime import datetime, timedelta, timezone
+
+import dayone
+import facebook
+
+################################################################################
+# local HTTP server that imitates a geocoding service with a fixed latency
+class FakeGeocoder:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, latency=0.05):
+        from http.server import ThreadingHTTPServer
+
+        self.latency = latency
+        self.requests = 0
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+        self.logger = logging.getLogger('benchmark.FakeGeocoder')
+
+    #---------------------------------------------------------------------------
+    def __enter__(self):
+        self.thread.start()
+        self.logger.debug(f'fake geocoder listening: {self.url}')
+        return self
+
+    #---------------------------------------------------------------------------
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    #---------------------------------------------------------------------------
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/geocode'
+
+    #---------------------------------------------------------------------------
+    def provider(self, query, reverse=False):
+        from urllib.parse import urlencode
+        from urllib.request import urlopen
+
+        if reverse is True:
+            params = urlencode({'lat' : query[0], 'lng' : query[1]})
+        else:
+            params = urlencode({'q' : query})
+
+        with urlopen(f'{self.url}?{params}') as resp:
+            data = json.load(resp)
+
+        place = dayone.Place()
+        place.name = data['name']
+        place.latitude = data['lat']
+        place.longitude = data['lng']
+        place.city = data['city']
+        place.country = data['country']
+
+        return place
+
+    #---------------------------------------------------------------------------
+    def _handler(self):
+        from urllib.parse import urlparse, parse_qs
+        from http.server import BaseHTTPRequestHandler
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                params = parse_qs(urlparse(self.path).query)
+
+                fake.requests += 1
+                time.sleep(fake.latency)
+
+                lat = float(params.get('lat', ['0'])[0])
+                lng = float(params.get('lng', ['0'])[0])
+
+                body = json.dumps({
+                    'name' : f'Place at {lat:.4f}, {lng:.4f}',
+                    'lat' : lat,
+                    'lng' : lng,
+                    'city' : 'Fakeville',
+                    'country' : 'Nowhere'
+                }).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+################################################################################
+# compare serial lookups against the GeoScheduler using the fake geocoder
+def bench_geocode(args):
+    # disable the persistent cache so every lookup reaches the geocoder
+    dayone.geocache = None
+    dayone.get_config()['geocache'] = { 'enabled' : False }
+
+    rand = random.Random(args.seed)
+
+    # repeat coordinates to exercise deduplication, like a real export
+    coords = [
+        [round(rand.uniform(-60, 60), 4), round(rand.uniform(-180, 180), 4)]
+        for _ in range(args.places)
+    ]
+    queries = [rand.choice(coords) for _ in range(args.lookups)]
+
+    results = dict()
+
+    with FakeGeocoder(latency=args.latency) as fake:
+        start = time.perf_counter()
+
+        for query in queries:
+            dayone.Place.lookup(query, reverse=True, provider=fake.provider)
+
+        results['serial'] = {
+            'seconds' : time.perf_counter() - start,
+            'requests' : fake.requests
+        }
+
+        fake.requests = 0
+
+        scheduler = dayone.GeoScheduler(
+            workers=args.workers, rate=args.rate, burst=args.burst, provider=fake.provider
+        )
+
+        start = time.perf_counter()
+
+        for query in queries:
+            scheduler.add(query, reverse=True)
+
+        scheduler.resolve()
+
+        for query in queries:
+            scheduler.lookup(query, reverse=True)
+
+        results['scheduled'] = {
+            'seconds' : time.perf_counter() - start,
+            'requests' : fake.requests
+        }
+
+    for name, result in results.items():
+        rate = args.lookups / result['seconds']
+        print(f'{name:>10}: {result["seconds"]:8.3f} s  {rate:10.1f} lookups/s  {result["requests"]:6d} requests')
+
+    return results
+
+################################################################################
+# geocoding provider used by the suite, so nothing reaches the network
+def stub_provider(query, reverse=False):
+    place = dayone.Place()
+
+    if reverse is True:
+        place.latitude, place.longitude = query
+        place.name = f'Place at {place.latitude:.4f}, {place.longitude:.4f}'
+    else:
+        place.name = str(query)
+
+    place.city = 'Fakeville'
+    place.country = 'Nowhere'
+
+    return place
+
+################################################################################
+# make sure benchmarks run offline and without persistent caches
+def _offline():
+    config = dayone.get_config()
+
+    dayone.geocache = None
+    config['geocache'] = { 'enabled' : False }
+
+    dayone.digest_index = None
+    config.pop('digests', None)
+
+    dayone.Place.provider = stub_provider
+
+################################################################################
+# synthetic Facebook export and Day One archive of a given size
+class Corpus:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, workdir, entries, photos=0, photo_size=64*1024, seed=42):
+        self.entries = entries
+        self.photos = photos
+        self.photo_size = photo_size
+        self.seed = seed
+
+        self.path = os.path.join(workdir, f'corpus-{entries}-{photos}')
+        self.media_dir = os.path.join(self.path, 'media')
+        self.posts_file = os.path.join(self.path, 'your_posts_1.json')
+        self.archive_file = os.path.join(self.path, 'journal.zip')
+
+        self.logger = logging.getLogger('benchmark.Corpus')
+
+    #---------------------------------------------------------------------------
+    def generate(self):
+        if os.path.exists(self.archive_file):
+            self.logger.debug(f'using existing corpus: {self.path}')
+            return
+
+        self.logger.info(f'generating corpus: {self.path}')
+
+        os.makedirs(self.media_dir, exist_ok=True)
+
+        rand = random.Random(self.seed)
+
+        media = list()
+
+        for idx in range(self.photos):
+            path = os.path.join(self.media_dir, f'photo_{idx}.jpg')
+
+            with open(path, 'wb') as fp:
+                fp.write(rand.randbytes(self.photo_size))
+
+            media.append(path)
+
+        # write posts one at a time so large corpora do not need much memory
+        with open(self.posts_file, 'w') as fp:
+            fp.write('[\n')
+
+            for idx in range(self.entries):
+                if idx > 0:
+                    fp.write(',\n')
+
+                post = self._post(idx, rand, media)
+                fp.write(json.dumps(post, indent=2))
+
+            fp.write('\n]\n')
+
+        _offline()
+
+        journal = dayone.Journal(name='Benchmark')
+        facebook.load_posts(self.posts_file, journal)
+
+        archive = dayone.Archive()
+        archive.add(journal)
+        archive.save(self.archive_file)
+
+    #---------------------------------------------------------------------------
+    def _post(self, idx, rand, media):
+        words = ' '.join(rand.choice(WORDS) for _ in range(rand.randint(5, 80)))
+
+        post = {
+            'timestamp' : 1262304000 + idx * 3600,
+            'data' : [ { 'post' : words } ]
+        }
+
+        attachments = list()
+
+        if len(media) > 0 and rand.random() < 0.5:
+            attachments.append({ 'data' : [ { 'media' : {
+                'uri' : rand.choice(media),
+                'title' : 'Mobile Uploads',
+                'description' : words[:40],
+                'media_metadata' : { 'photo_metadata' : {
+                    'latitude' : round(rand.uniform(-60, 60), 2),
+                    'longitude' : round(rand.uniform(-180, 180), 2)
+                }}
+            }}]})
+
+        if rand.random() < 0.2:
+            attachments.append({ 'data' : [ { 'place' : {
+                'name' : f'Place {rand.randint(0, 200)}',
+                'coordinate' : {
+                    'latitude' : round(rand.uniform(-60, 60), 2),
+                    'longitude' : round(rand.uniform(-180, 180), 2)
+                }
+            }}]})
+
+        if rand.random() < 0.2:
+            attachments.append({ 'data' : [ { 'external_context' : {
+                'name' : words[:20],
+                'url' : f'https://example.com/{idx}'
+            }}]})
+
+        if len(attachments) > 0:
+            post['attachments'] = attachments
+
+        return post
+
+WORDS = (
+    'the quick brown fox jumps over lazy dog today we went to a park and had '
+    'lunch with friends weather was great photos from trip happy birthday'
+).split()
+
+################################################################################
+# build the entries of a corpus in memory, outside of the timed section
+def _load_journal(corpus):
+    journal = dayone.Journal(name='Benchmark')
+    facebook.load_posts(corpus.posts_file, journal)
+
+    journal.entries = list(journal.iter_entries())
+    journal.source = None
+
+    return journal
+
+################################################################################
+def bench_load_posts(corpus):
+    journal = dayone.Journal(name='Benchmark')
+
+    start = time.perf_counter()
+    facebook.load_posts(corpus.posts_file, journal)
+    count = sum(1 for _ in journal.iter_entries())
+    elapsed = time.perf_counter() - start
+
+    return { 'seconds' : elapsed, 'items' : count, 'bytes' : os.path.getsize(corpus.posts_file) }
+
+################################################################################
+def bench_load_posts_pipeline(corpus):
+    journal = dayone.Journal(name='Benchmark')
+
+    start = time.perf_counter()
+    facebook.load_posts(corpus.posts_file, journal, pipeline=True)
+    count = sum(1 for _ in journal.iter_entries())
+    elapsed = time.perf_counter() - start
+
+    return { 'seconds' : elapsed, 'items' : count, 'bytes' : os.path.getsize(corpus.posts_file) }
+
+################################################################################
+def bench_journal_serialize(corpus):
+    journal = _load_journal(corpus)
+
+    start = time.perf_counter()
+    data = journal.serialize()
+    elapsed = time.perf_counter() - start
+
+    return { 'seconds' : elapsed, 'items' : len(data['entries']) }
+
+################################################################################
+def bench_archive_save(corpus):
+    journal = _load_journal(corpus)
+
+    archive = dayone.Archive()
+    archive.add(journal)
+
+    filename = os.path.join(corpus.path, 'save.zip')
+
+    start = time.perf_counter()
+    archive.save(filename)
+    elapsed = time.perf_counter() - start
+
+    size = os.path.getsize(filename)
+    os.remove(filename)
+
+    return { 'seconds' : elapsed, 'items' : len(journal.entries), 'bytes' : size }
+
+################################################################################
+def bench_archive_load(corpus):
+    start = time.perf_counter()
+    archive = dayone.Archive.load(corpus.archive_file)
+    count = sum(len(journal.entries) for journal in archive.journals)
+    elapsed = time.perf_counter() - start
+
+    return { 'seconds' : elapsed, 'items' : count, 'bytes' : os.path.getsize(corpus.archive_file) }
+
+################################################################################
+def bench_archive_load_lazy(corpus):
+    start = time.perf_counter()
+    archive = dayone.Archive.load(corpus.archive_file, lazy=True)
+    count = sum(1 for journal in archive.journals for _ in journal.iter_entries())
+    elapsed = time.perf_counter() - start
+
+    return { 'seconds' : elapsed, 'items' : count, 'bytes' : os.path.getsize(corpus.archive_file) }
+
+################################################################################
+def bench_archive_dump(corpus):
+    import contextlib
+
+    archive = dayone.Archive.load(corpus.archive_file)
+    count = sum(len(journal.entries) for journal in archive.journals)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        archive.dump()
+        elapsed = time.perf_counter() - start
+
+    return { 'seconds' : elapsed, 'items' : count }
+
+################################################################################
+def bench_archive_dump_ndjson(corpus):
+    archive = dayone.Archive.load(corpus.archive_file, lazy=True)
+
+    with open(os.devnull, 'w') as devnull:
+        start = time.perf_counter()
+        count = archive.dump(out=devnull, format='ndjson')
+        elapsed = time.perf_counter() - start
+
+    return { 'seconds' : elapsed, 'items' : count }
+
+################################################################################
+# memory held by the object model after an eager load, per entry
+def bench_archive_load_memory(corpus):
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    archive = dayone.Archive.load(corpus.archive_file)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = sum(len(journal.entries) for journal in archive.journals)
+
+    return {
+        'seconds' : elapsed,
+        'items' : count,
+        'bytes_per_entry' : size / max(count, 1),
+        'traced_peak' : peak
+    }
+
+################################################################################
+# time to build the index of a loaded archive, and the mean time of a query
+def bench_archive_index(corpus):
+    archive = dayone.Archive.load(corpus.archive_file)
+
+    start = time.perf_counter()
+    index = archive.index()
+    elapsed = time.perf_counter() - start
+
+    entries = index.by_time
+    rand = random.Random(corpus.seed)
+    queries = 0
+
+    query_start = time.perf_counter()
+
+    for _ in range(100):
+        entry = rand.choice(entries)
+
+        sum(1 for _ in index.between(entry.timestamp, entry.timestamp + timedelta(days=7)))
+        index.get(entry.id)
+        next(index.tagged(*entry.tags), None)
+
+        if entry.place is not None and entry.place.latitude is not None:
+            sum(1 for _ in index.near(float(entry.place.latitude), float(entry.place.longitude), 50))
+            queries += 1
+
+        queries += 3
+
+    query_time = (time.perf_counter() - query_start) / queries
+
+    return { 'seconds' : elapsed, 'items' : len(index), 'query_ms' : query_time * 1000 }
+
+BENCHMARKS = {
+    'load_posts' : bench_load_posts,
+    'load_posts_pipeline' : bench_load_posts_pipeline,
+    'journal_serialize' : bench_journal_serialize,
+    'archive_save' : bench_archive_save,
+    'archive_load' : bench_archive_load,
+    'archive_load_lazy' : bench_archive_load_lazy,
+    'archive_dump' : bench_archive_dump,
+    'archive_dump_ndjson' : bench_archive_dump_ndjson,
+    'archive_load_memory' : bench_archive_load_memory,
+    'archive_index' : bench_archive_index,
+}
+
+################################################################################
+# runs a single benchmark in a fresh process, so peak RSS is measured in isolation
+def _bench_child(name, corpus, queue, backend=None):
+    import resource
+
+    try:
+        _offline()
+
+        if backend is not None:
+            dayone.set_json_backend(backend)
+
+        result = BENCHMARKS[name](corpus)
+
+        # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak = peak // 1024
+
+        result['peak_rss_kb'] = peak
+
+        if result['seconds'] > 0:
+            result['items_per_sec'] = result['items'] / result['seconds']
+
+            if 'bytes' in result:
+                result['bytes_per_sec'] = result['bytes'] / result['seconds']
+
+    except Exception as err:
+        result = { 'error' : f'{type(err).__name__}: {err}' }
+
+    queue.put(result)
+
+################################################################################
+def run_isolated(name, corpus, backend=None):
+    import multiprocessing
+
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+
+    proc = ctx.Process(target=_bench_child, args=(name, corpus, queue, backend))
+    proc.start()
+
+    result = queue.get()
+    proc.join()
+
+    return result
+
+################################################################################
+# time each benchmark on each corpus size and save the results
+def bench_suite(args):
+    sizes = [ int(size) for size in args.sizes.split(',') ]
+    names = list(BENCHMARKS.keys())
+
+    if args.only is not None:
+        names = args.only.split(',')
+
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results = dict()
+
+    for size in sizes:
+        corpus = Corpus(args.workdir, size, photos=args.photos, photo_size=args.photo_size)
+        corpus.generate()
+
+        for name in names:
+            key = f'{name}@{size}'
+
+            for _ in range(args.repeat):
+                result = run_isolated(name, corpus, backend=args.json)
+
+                # keep the fastest run of each benchmark - failed runs are only
+                # kept when none of the runs succeeded
+                best = results.get(key)
+
+                if best is None or ('error' in best and 'error' not in result):
+                    results[key] = result
+
+                elif 'error' not in result and result['seconds'] < best['seconds']:
+                    results[key] = result
+
+            _print_result(key, results[key])
+
+    report = {
+        'meta' : {
+            'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'sizes' : sizes,
+            'photos' : args.photos,
+            'photo_size' : args.photo_size,
+            'json' : args.json or dayone.get_json_backend().name
+        },
+        'results' : results
+    }
+
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=4)
+
+    print(f'results saved: {args.output}')
+
+    return report
+
+################################################################################
+def _print_result(key, result):
+    if 'error' in result:
+        print(f'{key:>28}: ERROR {result["error"]}')
+        return
+
+    text = (
+        f'{key:>28}: {result["seconds"]:9.3f} s  '
+        f'{result.get("items_per_sec", 0):12.1f} items/s  '
+        f'{result["peak_rss_kb"] / 1024:9.1f} MB peak'
+    )
+
+    if 'bytes_per_entry' in result:
+        text += f'  {result["bytes_per_entry"]:9.1f} bytes/entry'
+
+    if 'query_ms' in result:
+        text += f'  {result["query_ms"]:9.3f} ms/query'
+
+    print(text)
+
+################################################################################
+# flag throughput drops and memory growth between two result files
+def bench_compare(args):
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)['results']
+
+    with open(args.current) as fp:
+        current = json.load(fp)['results']
+
+    regressions = 0
+
+    for key in sorted(set(baseline) & set(current)):
+        old = baseline[key]
+        new = current[key]
+
+        if 'error' in old or 'error' in new:
+            continue
+
+        # benchmarks without an item count are compared by their time
+        if old.get('items_per_sec') and new.get('items_per_sec'):
+            speed = new['items_per_sec'] / old['items_per_sec'] - 1
+        else:
+            speed = old['seconds'] / max(new['seconds'], 1e-9) - 1
+        memory = new['peak_rss_kb'] / old['peak_rss_kb'] - 1
+
+        flags = list()
+
+        if speed < -args.threshold:
+            flags.append('SLOWER')
+
+        if memory > args.threshold:
+            flags.append('MEMORY')
+
+        regressions += len(flags)
+
+        print(f'{key:>28}: throughput {speed:+8.1%}  peak RSS {memory:+8.1%}  {" ".join(flags)}')
+
+    if regressions > 0:
+        print(f'{regressions} regressions found (threshold: {args.threshold:.0%})')
+        sys.exit(1)
+
+################################################################################
+# reference implementations of the original timestamp codec
+def _legacy_format_timestamp(timestamp):
+    return timestamp.astimezone(tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _legacy_parse_timestamp(timestamp):
+    return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+
+################################################################################
+# check the timestamp codec against the reference and compare their speed
+def bench_timestamps(args):
+    rand = random.Random(args.seed)
+
+    offsets = [ timezone.utc, timezone(timedelta(hours=-7)), timezone(timedelta(hours=5, minutes=30)) ]
+
+    values = list()
+
+    for _ in range(args.count):
+        ts = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=rand.randint(0, 2**31))
+        values.append(ts.astimezone(rand.choice(offsets)))
+
+    # naive timestamps are treated as local time by both implementations
+    values.extend(ts.replace(tzinfo=None) for ts in values[:100])
+
+    texts = [ _legacy_format_timestamp(ts) for ts in values ]
+
+    # round trip - both codecs must agree on every value
+    for ts, text in zip(values, texts):
+        if dayone._format_timestamp(ts) != text:
+            raise ValueError(f'format mismatch: {ts!r} => {dayone._format_timestamp(ts)} != {text}')
+
+        if dayone._parse_timestamp(text) != _legacy_parse_timestamp(text):
+            raise ValueError(f'parse mismatch: {text}')
+
+    print(f'verified {len(values)} timestamps against the reference codec')
+
+    # repeat some values, as entries and photos share timestamps in real archives
+    samples = texts + texts[:len(texts) // 4]
+
+    for name, func, data in (
+        ('legacy format', _legacy_format_timestamp, values),
+        ('format', dayone._format_timestamp, values),
+        ('legacy parse', _legacy_parse_timestamp, samples),
+        ('parse', dayone._parse_timestamp, samples)
+    ):
+        dayone._parse_timestamp.cache_clear()
+
+        start = time.perf_counter()
+
+        for item in data:
+            func(item)
+
+        elapsed = time.perf_counter() - start
+        print(f'{name:>14}: {elapsed:8.3f} s  {len(data) / elapsed:12.1f} calls/s')
+
+################################################################################
+def main():
+    argp = argparse.ArgumentParser()
+    subp = argp.add_subparsers(dest='command', required=True)
+
+    geop = subp.add_parser('geocode', help='benchmark bulk geocoding')
+    geop.add_argument('--lookups', type=int, default=500, help='number of place lookups')
+    geop.add_argument('--places', type=int, default=100, help='number of unique places')
+    geop.add_argument('--latency', type=float, default=0.05, help='geocoder latency (seconds)')
+    geop.add_argument('--workers', type=int, default=8, help='scheduler worker threads')
+    geop.add_argument('--rate', type=float, default=None, help='scheduler requests per second')
+    geop.add_argument('--burst', type=int, default=1, help='scheduler burst size')
+    geop.add_argument('--seed', type=int, default=42, help='random seed for the corpus')
+    geop.set_defaults(func=bench_geocode)
+
+    suitep = subp.add_parser('suite', help='run the benchmark suite on synthetic corpora')
+    suitep.add_argument('--sizes', default='1000,10000', help='comma separated corpus sizes (entries)')
+    suitep.add_argument('--photos', type=int, default=50, help='number of distinct photos in each corpus')
+    suitep.add_argument('--photo-size', type=int, default=64*1024, help='size of each photo (bytes)')
+    suitep.add_argument('--only', help='comma separated list of benchmarks to run')
+    suitep.add_argument('--repeat', type=int, default=1, help='runs of each benchmark (fastest is kept)')
+    suitep.add_argument('--json', choices=('auto',) + dayone.JsonBackend.names, help='JSON backend to benchmark')
+    suitep.add_argument('--workdir', default='bench_data', help='directory for generated corpora')
+    suitep.add_argument('--output', default='bench_results.json', help='file to save the results')
+    suitep.set_defaults(func=bench_suite)
+
+    tsp = subp.add_parser('timestamps', help='verify and benchmark the timestamp codec')
+    tsp.add_argument('--count', type=int, default=100000, help='number of timestamps')
+    tsp.add_argument('--seed', type=int, default=42, help='random seed for the samples')
+    tsp.set_defaults(func=bench_timestamps)
+
+    cmpp = subp.add_parser('compare', help='compare two benchmark result files')
+    cmpp.add_argument('baseline', help='results from the reference run')
+    cmpp.add_argument('current', help='results from the run being checked')
+    cmpp.add_argument('--threshold', type=float, default=0.10, help='allowed change before flagging (fraction)')
+    cmpp.set_defaults(func=bench_compare)
+
+    args = argp.parse_args()
+    args.func(args)
+
+################################################################################
+## MAIN ENTRY
+if __name__ == '__main__':
+    main()
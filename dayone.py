@@ -1,19 +1,54 @@
 # define classes for handling Day One journal entries
 
+import io
 import re
 import os
+import sys
 import json
-import yaml
+import math
+import shutil
+import time
 import uuid
+import bisect
+import itertools
+import functools
 
 import logging
-import logging.config
 
 # XXX probably need to add a local working directoryto the config,
 #     especially a place where photos and videos can be managed
 
 from datetime import datetime, timezone
-from zipfile import ZipFile
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA
+
+################################################################################
+## profiling - stages are only timed while a profiler is running
+
+profiler = None
+
+def profiled(stage):
+    def decorate(func):
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if profiler is None:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(stage, start, time.perf_counter())
+
+        return timed
+
+    return decorate
+
+#-------------------------------------------------------------------------------
+def profile_bytes(stage, count):
+    if profiler is not None:
+        profiler.add_bytes(stage, count)
 
 ################################################################################
 class Archive:
@@ -21,6 +56,24 @@ class Archive:
     #---------------------------------------------------------------------------
     def __init__(self):
         self.journals = list()
+
+        # write journal JSON without indentation
+        self.compact = False
+
+        # number of processes used to hash photos (None hashes serially)
+        self.workers = None
+
+        # how members are compressed (None uses the policy from the config)
+        self.compression = None
+
+        # members written during the current save, used to skip duplicates
+        self.written = set()
+        self.digests = set()
+        self.stats = dict()
+
+        # index of the entries in all journals, built on first use
+        self._index = None
+
         self.logger = logging.getLogger('dayone.Archive')
 
     #---------------------------------------------------------------------------
@@ -28,478 +81,2510 @@ class Archive:
         self.logger.debug(f'Adding journal: {journal.name}')
         self.journals.append(journal)
 
+        if self._index is not None:
+            journal.watch(self._index)
+
+    #---------------------------------------------------------------------------
+    # index for querying the entries of all journals, kept up to date as entries
+    # are added - building it reads all entries of lazy journals
+    def index(self):
+        if self._index is None:
+            self._index = EntryIndex()
+
+            for journal in self.journals:
+                journal.watch(self._index)
+
+        return self._index
+
+    #---------------------------------------------------------------------------
+    # add the entries of another archive to the journals with the same name,
+    # adding journals that are not in this archive yet
+    # returns the names of the journals that were added or received new entries
+    def merge_entries(self, other):
+        journals = { journal.name : journal for journal in self.journals }
+        changed = set()
+
+        for journal in other.journals:
+            target = journals.get(journal.name)
+
+            if target is None:
+                self.add(journal)
+                changed.add(journal.name)
+                continue
+
+            for entry in journal.iter_entries():
+                target.add(entry)
+                changed.add(journal.name)
+
+        return changed
+
     #---------------------------------------------------------------------------
-    def load(filename):
+    @profiled('archive.load')
+    def load(filename, lazy=False):
+
+        # a manifest of shards is loaded as a single archive
+        if filename.endswith('.json'):
+            return Archive._load_shards(filename, lazy=lazy)
+
         archive = Archive()
-        archive.logger.info(f'Loading archive: {filename}')
+        archive.logger.info(f'Loading archive: {filename} (lazy:{lazy})')
 
         with ZipFile(filename, 'r') as myzip:
+
+            # photos stay in the archive, and are copied from it when saved again
+            media = Archive._media_members(myzip)
+
             for arcname in myzip.namelist():
 
                 # import all .json files in archive as journals
-                if arcname.endswith('.json'):
-                    archive.logger.debug(f'loading journal from archive: {arcname}')
+                if not arcname.endswith('.json'):
+                    continue
+
+                archive.logger.debug(f'loading journal from archive: {arcname}')
+
+                if lazy is True:
+                    source = ArchiveSource(filename, arcname)
+                    journal = Journal(name=source.name(), source=ChainSource([ source ]))
+
+                else:
                     raw = myzip.read(arcname)
-                    data = json.loads(raw)
+                    profile_bytes('archive.load', len(raw))
+                    data = get_json_backend().loads(raw)
                     journal = Journal.deserialize(data)
-                    archive.add(journal)
 
-            # TODO import photos - where to extract?
+                    Archive._attach_media(journal.entries, filename, media)
+
+                # Day One names journals after their file in the archive
+                if journal.name is None:
+                    journal.name = os.path.splitext(os.path.basename(arcname))[0]
+
+                archive.add(journal)
+
             # TODO import videos - where to extract?
 
         return archive
 
     #---------------------------------------------------------------------------
-    def save(self, filename):
-        self.logger.info(f'Saving archive: {filename}')
+    # members of an archive holding photos, by digest
+    def _media_members(myzip):
+        media = dict()
 
-        with ZipFile(filename, 'w') as myzip:
-            for journal in self.journals:
-                self._zip_journal(journal, myzip)
+        for arcname in myzip.namelist():
+            match = re.match(r'^photos/([0-9a-f]{32})\.\w+$', arcname)
+
+            if match is not None:
+                media[match.group(1)] = arcname
+
+        return media
 
     #---------------------------------------------------------------------------
-    def dump(self):
-        self.logger.debug(f'dumping archive')
+    def _attach_media(entries, filename, media):
+        for entry in entries:
+            for photo in entry.photos:
+                if photo.path is None and photo._digest in media:
+                    photo.path = ZipMember(filename, media[photo._digest])
 
-        # dump as YAML with multiple docs in stream
-        # XXX this is nice for viewing, but harder to compare against the original
-        print('%YAML 1.2')
+    #---------------------------------------------------------------------------
+    # add the entries of another archive, skipping entries that duplicate one that
+    # is already in this archive (or an earlier one from the other archive) - the
+    # entries are added to the journal with the same name
+    def merge(self, other, window=3600):
+        finder = DuplicateFinder(window=window)
+        journals = { journal.name : journal for journal in self.journals }
+
+        report = {
+            'entries' : 0,
+            'added' : 0,
+            'duplicates' : list(),
+            'reasons' : dict()
+        }
 
         for journal in self.journals:
-            data = journal.serialize()
-            print("---\n" + yaml.dump(data))
+            for entry in journal.iter_entries():
+                finder.add(entry)
 
-    #---------------------------------------------------------------------------
-    def _safe_journal_name(self, name):
-        if name is None:
-            return 'journal'
+        for journal in other.journals:
+            target = journals.get(journal.name)
 
-        # make sure the journal name is file safe
-        return re.sub(r'[^a-zA-Z0-9 _-]', '', name)
+            if target is None:
+                target = Journal(name=journal.name)
+                journals[journal.name] = target
+                self.add(target)
 
-    #---------------------------------------------------------------------------
-    def _zip_journal(self, journal, myzip):
-        self._zip_journal_json(journal, myzip)
+            for entry in journal.iter_entries():
+                report['entries'] += 1
 
-        for entry in journal.entries:
-            for photo in entry.photos:
-                self._zip_photo(photo, myzip)
+                original, reason = finder.find(entry)
 
-    #---------------------------------------------------------------------------
-    def _zip_journal_json(self, journal, myzip):
-        # export the journal as json
-        data = journal.serialize()
-        content = json.dumps(data, indent=4)
+                if original is not None:
+                    self.logger.debug(f'duplicate entry: {entry.id} => {original.id} ({reason})')
 
-        # make sure the journal name is file safe
-        arcname = self._safe_journal_name(journal.name)
-        arcname = f'{arcname}.json'
+                    report['duplicates'].append({
+                        'entry' : entry.id.hex,
+                        'duplicate_of' : original.id.hex,
+                        'journal' : journal.name,
+                        'reason' : reason
+                    })
 
-        self.logger.debug(f'journal data: {arcname} - {len(content)} bytes')
-        myzip.writestr(arcname, content)
+                    report['reasons'][reason] = report['reasons'].get(reason, 0) + 1
+                    continue
 
-    #---------------------------------------------------------------------------
-    def _zip_entry_exists(self, myzip, arcname):
-        try:
-            info = myzip.getinfo(arcname)
+                finder.add(entry)
+                target.add(entry)
 
-            # TODO improve logging information
-            self.logger.debug(f'{info}')
+                report['added'] += 1
 
-        except KeyError:
-            pass
+        self.logger.info(
+            f'Merged {report["entries"]} entries -- {report["added"]} added, '
+            f'{len(report["duplicates"])} duplicates skipped'
+        )
 
-        return False
+        return report
 
     #---------------------------------------------------------------------------
-    def _zip_photo(self, photo, myzip):
+    @profiled('archive.save')
+    def save(self, filename):
+        self.logger.info(f'Saving archive: {filename}')
 
-        # TODO get extension from photo type
-        arcname = f'photos/{photo.digest()}.jpeg'
+        policy = self._start_save()
 
-        # only add the photo if it doesn't exist in the archive...
-        if self._zip_entry_exists(myzip, arcname):
-            self.logger.debug(f'photo exists in archive - skipping: {photo.path}')
+        # the archive defaults apply to the journal data, media is set per member
+        with ZipFile(filename, 'w', compression=policy.method, compresslevel=policy.level) as myzip, \
+             MediaPool(self.workers) as media:
 
-        else:
-            self.logger.debug(f'adding photo to archive: {photo.path} => {arcname}')
-            myzip.write(photo.path, arcname=arcname)
+            for journal in self.journals:
+                self._zip_journal(journal, myzip, media, policy)
 
-################################################################################
-class Journal:
+        self._finish_save(filename)
+
+        return self.stats
 
     #---------------------------------------------------------------------------
-    def __init__(self, name=None):
-        self.entries = list()
-        self.name = name
+    # split the journals into several archives by entry count, size (in bytes) or
+    # year, and write a manifest listing them - the shards are written in parallel
+    # when workers are set, and each one has its own copy of the photos it uses
+    def save_shards(self, filename, by='count', limit=10000):
+        base = os.path.splitext(filename)[0]
+        shards = self._plan_shards(by, limit)
 
-        self.logger = logging.getLogger('dayone.Journal')
-        self.logger.info(f'New journal: {self.name}')
+        self.logger.info(f'Saving {len(shards)} shards: {base}-*.zip (by {by})')
 
-    #---------------------------------------------------------------------------
-    def add(self, entry):
-        self.logger.debug(f'Adding journal entry: {entry.id} -- {entry.title}')
-        self.entries.append(entry)
+        global shard_jobs
 
-    #---------------------------------------------------------------------------
-    def serialize(self):
-        entries = list()
+        shard_jobs = [ (shard, f'{base}-{key}.zip') for key, shard in shards.items() ]
+        jobs = range(len(shard_jobs))
 
-        for entry in self.entries:
-            data = entry.serialize()
-            entries.append(data)
+        # forked workers already have the entries, which are slow to send to them
+        if self.workers is not None and self.workers > 0 and len(jobs) > 1 and _can_fork():
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
 
-        data = {
-            'metadata' : {
-                'version': '1.0'
-            },
-            'entries' : entries
-        }
+            pool = ProcessPoolExecutor(
+                max_workers=min(self.workers, len(jobs)),
+                mp_context=multiprocessing.get_context('fork')
+            )
 
-        if self.name is not None:
-            data['name'] = self.name
+            with pool:
+                results = list(pool.map(_save_shard, jobs))
 
-        return data
+        else:
+            results = [ _save_shard(job) for job in jobs ]
 
-    #---------------------------------------------------------------------------
-    def deserialize(data):
-        journal = Journal()
+        jobs = shard_jobs
+        shard_jobs = None
 
-        if 'name' in data:
-            self.name = data['name']
+        manifest = {
+            'version' : 1,
+            'by' : by,
+            'shards' : list()
+        }
 
-        for entry_data in data['entries']:
-            entry = Entry.deserialize(entry_data)
-            journal.add(entry)
+        for key, (shard, path), stats in zip(shards.keys(), jobs, results):
+            manifest['shards'].append({
+                'file' : os.path.basename(path),
+                'key' : key,
+                'entries' : sum(len(journal.entries) for journal in shard.journals),
+                'bytes' : os.path.getsize(path),
+                'photos' : stats['files_written'] - len(shard.journals)
+            })
 
-        return journal
+        with open(f'{base}.json', 'w') as fp:
+            json.dump(manifest, fp, indent=4)
 
-################################################################################
-class Entry:
+        self.logger.info(f'Saved shard manifest: {base}.json')
+
+        return manifest
 
     #---------------------------------------------------------------------------
-    def __init__(self, id=None):
-        if id is None:
-            self.id = uuid.uuid4()
-        else:
-            self.id = id
+    # assign the entries to shards, keeping journal names and entry order
+    def _plan_shards(self, by, limit):
+        backend = get_json_backend()
 
-        self.title = None
-        self.body = None
-        self.tags = list()
-        self.place = None
-        self.weather = None
-        self.photos = list()
+        shards = dict()
+        key = None
+        count = 0
+        size = 0
+        paths = set()
 
-        self.timestamp = datetime.now()
-        self.timezone = None
+        for journal in self.journals:
+            for entry in journal.iter_entries():
 
-        self.logger = logging.getLogger('dayone.Entry')
+                if by == 'year':
+                    key = str(entry.timestamp.year)
 
-    #---------------------------------------------------------------------------
-    def __repr__(self):
-        return "Entry(%s)" % (self.id)
+                elif by == 'count':
+                    if key is None or count >= limit:
+                        key = f'{len(shards) + 1:03d}'
+                        count = 0
 
-    #---------------------------------------------------------------------------
-    def append(self, text):
-        if self.body is None:
-            self.body = text
-        else:
-            self.body += f'\n{text}'
+                    count += 1
 
-    #---------------------------------------------------------------------------
-    def markdown(self):
-        text = ''
+                elif by == 'bytes':
+                    entry_size = Archive._estimate_size(entry, backend)
+                    new_paths = set(photo.path for photo in entry.photos if photo.path is not None) - paths
 
-        if self.title is not None:
-            text += f'# {self.title}\n'
+                    entry_size += sum(_media_size(path) for path in new_paths)
 
-        if self.body is not None:
-            text += self.body
+                    # a new shard is started when the entry does not fit, unless it is empty
+                    if key is None or (size > 0 and size + entry_size > limit):
+                        key = f'{len(shards) + 1:03d}'
+                        size = 0
+                        paths = set()
 
-        return text
+                    size += entry_size
+                    paths.update(photo.path for photo in entry.photos if photo.path is not None)
 
-    #---------------------------------------------------------------------------
-    def serialize(self):
-        entry = {
-            'uuid' : self.id.hex,
-            'creationDate' : _format_timestamp(self.timestamp),
-            'tags' : self.tags,
-            'text' : self.markdown()
-        }
+                else:
+                    raise ValueError(f'unknown shard type: {by}')
 
-        if self.place is not None:
-            entry['location'] = self.place.serialize()
+                shard = shards.get(key)
 
-        if self.timezone is not None:
-            entry['timeZoneName'] = self.timezone.tzname
+                if shard is None:
+                    shard = Archive()
+                    shard.compact = self.compact
+                    shard.compression = self.compression
+                    shards[key] = shard
 
-        if self.weather is not None:
-            entry['weather'] = self.weather.serialize()
+                target = next((other for other in shard.journals if other.name == journal.name), None)
 
-        if len(self.photos) > 0:
-            entry['photos'] = self._serialize_photos()
+                if target is None:
+                    target = Journal(name=journal.name)
+                    shard.add(target)
 
-        # TODO process videos
+                target.entries.append(entry)
 
-        return entry
+        return dict(sorted(shards.items()))
 
     #---------------------------------------------------------------------------
-    def _serialize_photos(self):
-        data = list()
+    # JSON size of an entry, without hashing its photos - digests have a fixed
+    # length, so a placeholder is serialized and the shard workers hash them
+    def _estimate_size(entry, backend):
+        import copy
 
-        for photo in self.photos:
-            photo_data = photo.serialize()
+        sized = copy.copy(entry)
+        sized.photos = list()
 
-            if photo_data is not None:
-                data.append(photo_data)
+        for photo in entry.photos:
+            if photo._digest is None and photo.path is not None:
+                photo = copy.copy(photo)
+                photo._digest = '0' * 32
 
-        return data
+            sized.photos.append(photo)
+
+        return len(backend.dumps(sized.serialize()))
 
     #---------------------------------------------------------------------------
-    def deserialize(data):
-        entry_id = None
+    # reads the shards listed in a manifest as one archive, combining the journals
+    # with the same name
+    def _load_shards(filename, lazy=False):
+        with open(filename) as fp:
+            manifest = json.load(fp)
 
-        if 'uuid' in data:
-            entry_id = uuid.UUID(hex=data['uuid'])
+        archive = Archive()
+        archive.logger.info(f'Loading shards: {filename} ({len(manifest["shards"])} shards)')
 
-        entry = Entry(id=entry_id)
+        journals = dict()
+        folder = os.path.dirname(filename)
 
-        if 'tags' in data:
-            entry.tags = data['tags']
+        for info in manifest['shards']:
+            shard = Archive.load(os.path.join(folder, info['file']), lazy=lazy)
 
-        if 'creationDate' in data:
-            entry.timestamp = _parse_timestamp(data['creationDate'])
+            for journal in shard.journals:
+                target = journals.get(journal.name)
 
-        if 'text' in data:
-            # TODO split title if present
-            text = data['text']
-            entry.body = text
+                if target is None:
+                    journals[journal.name] = journal
+                    archive.add(journal)
 
-        if 'location' in data:
-            entry.place = Place.deserialize(data['location'])
+                elif lazy is True:
+                    target.source.add(journal.source)
 
-        if 'weather' in data:
-            entry.weather = Weather.deserialize(data['weather'])
+                else:
+                    target.entries.extend(journal.entries)
 
-        if 'photos' in data:
-            entry.photos = Entry._deserialize_photos(data['photos'])
+        return archive
 
-        # TODO process timeZone
-        # TODO process videos
+    #---------------------------------------------------------------------------
+    # add the journals to an existing archive - photos already in the archive are
+    # not written again and only the JSON of these journals is replaced; only the
+    # named journals are written (all of them by default), the others are left as
+    # they are
+    @profiled('archive.update')
+    def update(self, filename, journals=None):
+        import tempfile
+
+        self.logger.info(f'Updating archive: {filename}')
+
+        policy = self._start_save()
+        staged = list()
+
+        # journal data is staged in temporary files first, since lazy journals
+        # may be reading their entries from this archive
+        with MediaPool(self.workers) as media:
+            for journal in self.journals:
+                if journals is not None and journal.name not in journals:
+                    continue
 
-        return entry
+                photos = list()
+                start = time.perf_counter()
 
-    #---------------------------------------------------------------------------
-    def _deserialize_photos(data):
-        photos = list()
+                tmp = tempfile.TemporaryFile()
+                self._write_journal_json(journal, tmp, photos, media)
 
-        for photo_data in data:
-            photo = Photo.deserialize(photo_data)
-            if photo is not None:
-                photos.append(photo)
+                staged.append((journal, tmp, photos, time.perf_counter() - start))
 
-        return photos
+        with ZipFile(filename, 'a', compression=policy.method, compresslevel=policy.level) as myzip:
 
-################################################################################
-class Media:
+            # existing photos are found from the central directory, without reading them
+            for zinfo in myzip.infolist():
+                self.written.add(zinfo.filename)
 
-    #---------------------------------------------------------------------------
-    def __init__(self, id=None):
-        if id is None:
-            self.id = uuid.uuid4()
-        else:
-            self.id = id
+                match = re.match(r'^photos/([0-9a-f]{32})\.\w+$', zinfo.filename)
 
-        self.caption = None
-        self.timestamp = None
+                if match is not None:
+                    self.digests.add(match.group(1))
 
-        self.logger = logging.getLogger('dayone.Media')
+            for journal, tmp, photos, elapsed in staged:
+                arcname = self._journal_arcname(journal)
 
-    #---------------------------------------------------------------------------
-    def markdown(self):
-        if self.caption is None:
-            return f'![](dayone-moment://{self.id.hex})'
+                if arcname in self.written:
+                    self._drop_member(myzip, arcname)
 
-        return f'![{self.caption}](dayone-moment://{self.id.hex})'
+                start = time.perf_counter()
 
-################################################################################
-# TODO add support for remote photos, e.g. specify using path or uri
-# TODO add support for paths to photos embedded in a zipfile
-class Photo(Media):
+                with tmp:
+                    tmp.seek(0)
 
-    #---------------------------------------------------------------------------
-    def __init__(self, path, id=None):
-        Media.__init__(self, id=id)
+                    with myzip.open(arcname, 'w') as fp:
+                        shutil.copyfileobj(tmp, fp)
 
-        self.path = path
+                    size = tmp.tell()
 
-        self.logger = logging.getLogger('dayone.Photo')
-        self.logger.debug(f'New photo: {self.id} -- {self.path}')
+                elapsed += time.perf_counter() - start
 
-    #---------------------------------------------------------------------------
-    def digest(self):
-        import hashlib
+                self._record_compression(myzip.getinfo(arcname), elapsed)
+                self._record_journal(arcname, size)
 
-        if self.path is None:
-            return None
+                for photo in photos:
+                    # photos read from this archive are already in it, and must
+                    # not be read through another handle while it is appended
+                    if Archive._is_member_of(photo.path, filename):
+                        self.stats['files_skipped'] += 1
+                        self.stats['bytes_skipped'] += myzip.getinfo(photo.path.name).file_size
+                    else:
+                        self._zip_photo(photo, myzip, policy)
 
-        md5 = hashlib.md5()
-        with open(self.path, 'rb') as infile:
-            md5.update(infile.read())
+        self._finish_save(filename)
 
-        return md5.hexdigest()
+        return self.stats
 
     #---------------------------------------------------------------------------
-    def serialize(self):
-        data = {
-            'identifier' : self.id.hex,
-            'title' : self.caption,
-            'md5' : self.digest()
-        }
+    # write the entries as they are read, as YAML with a document per journal or as
+    # one JSON record per entry (jsonl is sorted and spaced, ndjson is compact) -
+    # entries may be limited to a date range, to entries with all of the given tags
+    # and to a maximum count
+    def dump(self, out=None, format='yaml', since=None, until=None, tags=None, limit=None):
+        self.logger.debug(f'dumping archive -- format: {format}')
 
-        if self.timestamp is not None:
-            data['date'] = _format_timestamp(self.timestamp)
+        if out is None:
+            out = sys.stdout
 
-        return data
+        match = Archive._dump_filter(since, until, tags)
+        count = 0
 
-    #---------------------------------------------------------------------------
-    def deserialize(data):
-        photo_id = None
+        if format == 'yaml':
+            out.write('%YAML 1.2\n')
 
-        if 'identifier' in data:
-            photo_id = uuid.UUID(hex=data['identifier'])
+        elif format == 'ndjson':
+            backend = get_json_backend()
 
-        photo = Photo(path=None, id=photo_id)
+        elif format != 'jsonl':
+            raise ValueError(f'unknown dump format: {format}')
 
-        # TODO need to store and deserialize the photo name / md5
-        if 'file_reference' in data:
-            photo.name = data['file_reference']
+        for journal in self.journals:
+            # later journals are not read once the limit is reached
+            if limit is not None and count >= limit:
+                break
 
-        if 'title' in data:
-            photo.caption = data['title']
+            entries = (data for data in journal.serialize_entries() if match(data))
 
-        if 'date' in data:
-            photo.timestamp = _parse_timestamp(data['date'])
+            if limit is not None:
+                entries = itertools.islice(entries, max(limit - count, 0))
 
-        return photo
+            if format == 'yaml':
+                count += self._dump_yaml(journal, entries, out)
+                continue
 
-################################################################################
-class Place:
+            for data in entries:
+                record = { 'journal' : journal.name, 'entry' : data }
 
-    # TODO add timeZone support
-    # http://api.geonames.org/timezone?lat=47.01&lng=10.2&username=demo
+                if format == 'jsonl':
+                    out.write(json.dumps(record, sort_keys=True, ensure_ascii=False) + '\n')
+                else:
+                    out.write(backend.dumps(record).decode('utf-8') + '\n')
 
-    #---------------------------------------------------------------------------
-    def __init__(self):
-        self.name = None
-        self.city = None
-        self.state = None
-        self.country = None
-        self.longitude = None
-        self.latitude = None
+                count += 1
 
-        self.logger = logging.getLogger('dayone.Place')
+        out.flush()
+
+        return count
 
     #---------------------------------------------------------------------------
-    # TODO apply rate limit to API calls - https://docs.mapbox.com/api/#rate-limits
-    def lookup(query, reverse=False):
-        import geocoder
+    # dump as YAML with multiple docs in stream
+    # XXX this is nice for viewing, but harder to compare against the original
+    def _dump_yaml(self, journal, entries, out, batch_size=64):
+        import yaml
 
-        place = Place()
+        # prefer the libyaml emitter when it is available - it wraps long strings
+        # differently, so its output may not match the pure Python emitter
+        dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
 
-        place.logger.debug(f'Looking up place (reverse:{reverse}) -- {query}')
+        out.write('---\n')
 
-        # TODO use the provider preference from the config
-        api_key = config['mapbox']['key']
+        count = 0
+        batch = list()
 
-        if reverse is True:
-            loc = geocoder.mapbox(query, method='reverse', key=api_key)
-        else:
-            loc = geocoder.mapbox(query, key=api_key)
+        # keys are sorted, so the entries come before the journal metadata - they
+        # are written in small batches so output starts right away
+        for data in entries:
+            if count == 0:
+                out.write('entries:\n')
 
-        place.logger.debug(f'> result: {loc}')
+            batch.append(data)
+            count += 1
 
-        place.name = loc.address
-        place.latitude = loc.lat
-        place.longitude = loc.lng
-        place.city = loc.city
-        place.state = loc.state
-        place.country = loc.country
+            if len(batch) >= batch_size:
+                out.write(yaml.dump(batch, Dumper=dumper))
+                out.flush()
+                batch = list()
 
-        return place
+        if len(batch) > 0:
+            out.write(yaml.dump(batch, Dumper=dumper))
 
-    #---------------------------------------------------------------------------
-    def markdown(self):
-        text = ''
+        if count == 0:
+            out.write('entries: []\n')
 
-        if self.name is not None:
-            text += f'## {self.name}\n'
+        header = { 'metadata' : journal.metadata() }
 
-        location = ', '.join(filter(None, (self.city, self.state, self.country)))
-        if location is not None and len(location) > 0:
-            text += location + '\n'
+        if journal.name is not None:
+            header['name'] = journal.name
 
-        if self.latitude is not None and self.longitude is not None:
-            text += f'GPS: {self.latitude}, {self.longitude}'
+        out.write(yaml.dump(header, Dumper=dumper) + '\n')
 
-        return text
+        return count
 
     #---------------------------------------------------------------------------
-    def serialize(self):
-        return {
+    # filters are applied to the serialized entries, so lazy journals are not parsed
+    def _dump_filter(since=None, until=None, tags=None):
+
+        def match(data):
+            if since is not None or until is not None:
+                if 'creationDate' not in data:
+                    return False
+
+                when = _parse_timestamp(data['creationDate'])
+
+                if since is not None and when < since:
+                    return False
+
+                if until is not None and when >= until:
+                    return False
+
+            if tags is not None:
+                entry_tags = data.get('tags', ())
+
+                if not all(tag in entry_tags for tag in tags):
+                    return False
+
+            return True
+
+        return match
+
+    #---------------------------------------------------------------------------
+    def _safe_journal_name(self, name):
+        if name is None:
+            return 'journal'
+
+        # make sure the journal name is file safe
+        return re.sub(r'[^a-zA-Z0-9 _-]', '', name)
+
+    #---------------------------------------------------------------------------
+    def _zip_journal(self, journal, myzip, media=None, policy=None):
+        photos = list()
+
+        # photos are collected while the JSON is written, since the zip
+        # cannot add other members until the journal data is complete
+        self._zip_journal_json(journal, myzip, photos, media)
+
+        for photo in photos:
+            self._zip_photo(photo, myzip, policy)
+
+    #---------------------------------------------------------------------------
+    def _journal_arcname(self, journal):
+        # make sure the journal name is file safe
+        arcname = self._safe_journal_name(journal.name)
+        return f'{arcname}.json'
+
+    #---------------------------------------------------------------------------
+    def _start_save(self):
+        self.written = set()
+        self.digests = set()
+
+        self.stats = {
+            'files_written' : 0,
+            'bytes_written' : 0,
+            'files_skipped' : 0,
+            'bytes_skipped' : 0,
+            'compression' : dict()
+        }
+
+        if self.compression is not None:
+            return self.compression
+
+        return new_compression_policy()
+
+    #---------------------------------------------------------------------------
+    def _finish_save(self, filename):
+        self.logger.info(
+            f'Saved archive: {filename} -- '
+            f'{self.stats["files_written"]} files written ({self.stats["bytes_written"]} bytes), '
+            f'{self.stats["files_skipped"]} duplicates skipped ({self.stats["bytes_skipped"]} bytes)'
+        )
+
+        for kind, info in self.stats['compression'].items():
+            ratio = info['compressed'] / info['bytes'] if info['bytes'] > 0 else 1
+
+            self.logger.info(
+                f'> {kind}: {info["files"]} files, {info["bytes"]} => {info["compressed"]} bytes '
+                f'({ratio:.1%}) in {info["seconds"]:.3f} s'
+            )
+
+    #---------------------------------------------------------------------------
+    def _is_member_of(path, filename):
+        if not isinstance(path, ZipMember):
+            return False
+
+        return os.path.abspath(path.archive) == os.path.abspath(filename)
+
+    #---------------------------------------------------------------------------
+    # remove a member from the central directory of an archive opened for append -
+    # its data is left in place as unused space until the archive is saved again
+    def _drop_member(self, myzip, arcname):
+        for zinfo in [ zinfo for zinfo in myzip.filelist if zinfo.filename == arcname ]:
+            self.logger.debug(f'replacing archive member: {arcname} ({zinfo.compress_size} bytes unused)')
+            myzip.filelist.remove(zinfo)
+
+        myzip.NameToInfo.pop(arcname, None)
+        self.written.discard(arcname)
+
+    #---------------------------------------------------------------------------
+    def _record_journal(self, arcname, size):
+        self.logger.debug(f'journal data: {arcname} - {size} bytes')
+        profile_bytes('archive.journal_json', size)
+
+        self.written.add(arcname)
+
+        self.stats['files_written'] += 1
+        self.stats['bytes_written'] += size
+
+    #---------------------------------------------------------------------------
+    def _zip_journal_json(self, journal, myzip, photos=None, media=None):
+        arcname = self._journal_arcname(journal)
+
+        # export the journal as json, streaming one entry at a time - the time
+        # recorded for the member includes serializing the entries
+        start = time.perf_counter()
+
+        with myzip.open(arcname, 'w') as fp:
+            size = self._write_journal_json(journal, fp, photos, media)
+
+        self._record_compression(myzip.getinfo(arcname), time.perf_counter() - start)
+        self._record_journal(arcname, size)
+
+    #---------------------------------------------------------------------------
+    @profiled('archive.journal_json')
+    def _write_journal_json(self, journal, fp, photos=None, media=None):
+        backend = get_json_backend()
+
+        header = { 'metadata' : journal.metadata() }
+
+        if journal.name is not None:
+            header['name'] = journal.name
+
+        if self.compact:
+            pad_key = b''
+            pad_entry = b''
+            separator = b':'
+        else:
+            pad_key = b'\n' + b' ' * backend.indent
+            pad_entry = pad_key + b' ' * backend.indent
+            separator = b': '
+
+        # reopen the header object and start the entries list
+        raw = backend.dumps(header, pretty=not self.compact)
+        raw = raw[:-1].rstrip() + b',' + pad_key + b'"entries"' + separator + b'['
+
+        size = 0
+        first = True
+
+        for data in journal.serialize_entries(photos, media):
+            if first is False:
+                raw += b','
+
+            content = backend.dumps(data, pretty=not self.compact)
+
+            if not self.compact:
+                content = pad_entry + content.replace(b'\n', pad_entry)
+
+            raw += content
+
+            fp.write(raw)
+            size += len(raw)
+
+            raw = b''
+            first = False
+
+        if first is False:
+            raw += pad_key
+
+        raw += b']'
+
+        if not self.compact:
+            raw += b'\n'
+
+        raw += b'}'
+
+        fp.write(raw)
+        size += len(raw)
+
+        return size
+
+    #---------------------------------------------------------------------------
+    def _zip_entry_exists(self, myzip, arcname):
+        return arcname in self.written
+
+    #---------------------------------------------------------------------------
+    # size of a photo that is already in the archive being written, without opening
+    # its source if that is the archive itself
+    def _member_size(myzip, arcname, path):
+        if arcname in myzip.NameToInfo:
+            return myzip.getinfo(arcname).file_size
+
+        return _media_size(path)
+
+    #---------------------------------------------------------------------------
+    @profiled('archive.zip_photo')
+    def _zip_photo(self, photo, myzip, policy=None):
+
+        digest = photo.digest()
+
+        # photos without a source file cannot be added to the archive
+        if digest is None:
+            return
+
+        arcname = f'photos/{digest}{_media_ext(photo.path)}'
+
+        # only add the photo if it doesn't exist in the archive...
+        if digest in self.digests or self._zip_entry_exists(myzip, arcname):
+            self.logger.debug(f'photo exists in archive - skipping: {photo.path}')
+            self.stats['files_skipped'] += 1
+            self.stats['bytes_skipped'] += Archive._member_size(myzip, arcname, photo.path)
+
+        else:
+            size = _media_size(photo.path)
+            self.logger.debug(f'adding photo to archive: {photo.path} => {arcname}')
+
+            if policy is None:
+                policy = CompressionPolicy()
+
+            method, level = policy.member(arcname)
+            start = time.perf_counter()
+
+            if isinstance(photo.path, ZipMember):
+                self._zip_member(photo.path, myzip, arcname, method, level)
+            else:
+                myzip.write(photo.path, arcname=arcname, compress_type=method, compresslevel=level)
+
+            self._record_compression(myzip.getinfo(arcname), time.perf_counter() - start)
+            profile_bytes('archive.zip_photo', size)
+
+            self.written.add(arcname)
+            self.digests.add(digest)
+
+            self.stats['files_written'] += 1
+            self.stats['bytes_written'] += size
+
+    #---------------------------------------------------------------------------
+    # copy a member of another zip archive as a stream, without extracting it
+    def _zip_member(self, member, myzip, arcname, method, level):
+        source = member.info()
+
+        zinfo = ZipInfo(arcname, date_time=source.date_time)
+        zinfo.compress_type = method
+        zinfo._compresslevel = level
+
+        # the size is needed up front to decide if zip64 extensions are used
+        zinfo.file_size = source.file_size
+
+        with member.open() as infile, myzip.open(zinfo, 'w') as outfile:
+            shutil.copyfileobj(infile, outfile, 1024*1024)
+
+    #---------------------------------------------------------------------------
+    def _record_compression(self, zinfo, seconds):
+        kind = os.path.splitext(zinfo.filename)[1].lstrip('.').lower() or 'other'
+
+        info = self.stats['compression'].setdefault(kind, {
+            'files' : 0, 'bytes' : 0, 'compressed' : 0, 'seconds' : 0.0
+        })
+
+        info['files'] += 1
+        info['bytes'] += zinfo.file_size
+        info['compressed'] += zinfo.compress_size
+        info['seconds'] += seconds
+
+################################################################################
+# decides how each member of an archive is compressed - journal data compresses
+# well, while most media is already compressed and is stored as-is
+class CompressionPolicy:
+
+    methods = {
+        'stored' : ZIP_STORED,
+        'deflate' : ZIP_DEFLATED,
+        'bzip2' : ZIP_BZIP2,
+        'lzma' : ZIP_LZMA
+    }
+
+    # media formats that are already compressed
+    compressed = (
+        '.jpeg', '.jpg', '.png', '.gif', '.heic', '.heif', '.webp',
+        '.mp4', '.mov', '.m4v', '.m4a', '.mp3', '.aac', '.zip', '.gz'
+    )
+
+    #---------------------------------------------------------------------------
+    def __init__(self, method='deflate', level=6, media='deflate'):
+        self.method = self.methods[method]
+        self.level = level
+
+        # used for media that is not in a compressed format
+        self.media = self.methods[media]
+
+    #---------------------------------------------------------------------------
+    def member(self, arcname):
+        ext = os.path.splitext(arcname)[1].lower()
+
+        if ext in self.compressed:
+            return ZIP_STORED, None
+
+        if ext == '.json':
+            return self.method, self.level
+
+        return self.media, self.level
+
+################################################################################
+class Journal:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, name=None, source=None):
+        self.entries = list()
+        self.name = name
+
+        # optional source of entries that are read on demand
+        self.source = source
+
+        # indexes that are updated when entries are added
+        self.indexes = list()
+        self._index = None
+
+        self.logger = logging.getLogger('dayone.Journal')
+        self.logger.info(f'New journal: {self.name}')
+
+    #---------------------------------------------------------------------------
+    def add(self, entry):
+        self.logger.debug(f'Adding journal entry: {entry.id} -- {entry.title}')
+        self.entries.append(entry)
+
+        for index in self.indexes:
+            index.add(entry)
+
+    #---------------------------------------------------------------------------
+    # index for querying the entries of the journal, built on first use
+    def index(self):
+        if self._index is None:
+            self._index = EntryIndex()
+            self.watch(self._index)
+
+        return self._index
+
+    #---------------------------------------------------------------------------
+    # add the current entries to the index and keep it up to date
+    def watch(self, index):
+        index.extend(self.iter_entries())
+        self.indexes.append(index)
+
+    #---------------------------------------------------------------------------
+    def iter_entries(self):
+        if self.source is not None:
+            yield from self.source.entries()
+
+        yield from self.entries
+
+    #---------------------------------------------------------------------------
+    def count(self):
+        count = len(self.entries)
+
+        if self.source is None:
+            return count
+
+        if hasattr(self.source, 'data'):
+            return count + sum(1 for _ in self.source.data())
+
+        return count + sum(1 for _ in self.source.entries())
+
+    #---------------------------------------------------------------------------
+    def metadata(self):
+        return {
+            'version': '1.0'
+        }
+
+    #---------------------------------------------------------------------------
+    def serialize_entries(self, photos=None, media=None):
+        entries = self.entries
+
+        # source data that is already serialized is passed through as-is
+        if self.source is not None and hasattr(self.source, 'data'):
+            for data in self.source.data():
+                if photos is not None and hasattr(self.source, 'photos'):
+                    photos.extend(self.source.photos(data))
+
+                yield data
+
+        elif self.source is not None:
+            entries = self.iter_entries()
+
+        # hash photos ahead of serializing their entries
+        if media is not None:
+            entries = media.prefetch(entries)
+
+        # photos of the serialized entries are collected if a list is given
+        for entry in entries:
+            if photos is not None:
+                photos.extend(entry.photos)
+
+            yield entry.serialize()
+
+    #---------------------------------------------------------------------------
+    def serialize(self):
+        data = {
+            'metadata' : self.metadata(),
+            'entries' : list(self.serialize_entries())
+        }
+
+        if self.name is not None:
+            data['name'] = self.name
+
+        return data
+
+    #---------------------------------------------------------------------------
+    def deserialize(data):
+        journal = Journal()
+
+        if 'name' in data:
+            journal.name = data['name']
+
+        for entry_data in data['entries']:
+            entry = Entry.deserialize(entry_data)
+            journal.add(entry)
+
+        return journal
+
+################################################################################
+# lookup tables for finding entries by id, date, tag and location without scanning
+# every entry - queries return iterators over the matching entries
+class EntryIndex:
+
+    # size of the cells in the spatial grid, in degrees
+    grid_size = 0.5
+
+    #---------------------------------------------------------------------------
+    def __init__(self, entries=None):
+        self.ids = dict()
+        self.tags = dict()
+        self.grid = dict()
+
+        # entries sorted by timestamp, with the matching POSIX times for bisect
+        self.times = list()
+        self.by_time = list()
+
+        if entries is not None:
+            self.extend(entries)
+
+    #---------------------------------------------------------------------------
+    def __len__(self):
+        return len(self.ids)
+
+    #---------------------------------------------------------------------------
+    def add(self, entry):
+        key = EntryIndex._time_key(entry.timestamp)
+        idx = bisect.bisect_right(self.times, key)
+
+        self.times.insert(idx, key)
+        self.by_time.insert(idx, entry)
+
+        self._add_lookups(entry)
+
+    #---------------------------------------------------------------------------
+    def extend(self, entries):
+        import heapq
+
+        entries = list(entries)
+
+        # sorting once and merging is faster than inserting entries one at a time
+        keyed = sorted(
+            ((EntryIndex._time_key(entry.timestamp), entry) for entry in entries),
+            key=lambda item: item[0]
+        )
+
+        # entries already in the index come first when times are equal, as with add()
+        if len(self.times) > 0:
+            keyed = list(heapq.merge(zip(self.times, self.by_time), keyed, key=lambda item: item[0]))
+
+        self.times = [ key for key, entry in keyed ]
+        self.by_time = [ entry for key, entry in keyed ]
+
+        for entry in entries:
+            self._add_lookups(entry)
+
+    #---------------------------------------------------------------------------
+    def get(self, entry_id):
+        if isinstance(entry_id, str):
+            entry_id = uuid.UUID(hex=entry_id)
+
+        return self.ids.get(entry_id)
+
+    #---------------------------------------------------------------------------
+    # entries from start (inclusive) until end (exclusive), in date order
+    def between(self, start=None, end=None):
+        first = 0
+        last = len(self.times)
+
+        if start is not None:
+            first = bisect.bisect_left(self.times, EntryIndex._time_key(start))
+
+        if end is not None:
+            last = bisect.bisect_left(self.times, EntryIndex._time_key(end))
+
+        return iter(self.by_time[first:last])
+
+    #---------------------------------------------------------------------------
+    # entries that have all of the given tags, in the order they were added
+    def tagged(self, *tags):
+        if len(tags) == 0:
+            return iter(())
+
+        # start from the rarest tag, checking the others by membership
+        postings = sorted((self.tags.get(tag, dict()) for tag in tags), key=len)
+        others = postings[1:]
+
+        if len(others) == 0:
+            return iter(postings[0].values())
+
+        return (
+            entry for key, entry in postings[0].items()
+            if all(key in other for other in others)
+        )
+
+    #---------------------------------------------------------------------------
+    # entries with a place within the given bounding box
+    def within(self, south, west, north, east):
+        size = EntryIndex.grid_size
+
+        for row in range(math.floor(south / size), math.floor(north / size) + 1):
+            for col in range(math.floor(west / size), math.floor(east / size) + 1):
+                for entry in self.grid.get((row, col), ()):
+                    lat = float(entry.place.latitude)
+                    lng = float(entry.place.longitude)
+
+                    if south <= lat <= north and west <= lng <= east:
+                        yield entry
+
+    #---------------------------------------------------------------------------
+    # entries with a place within the given distance (in km) of a point
+    def near(self, latitude, longitude, km):
+        dlat = km / 111.2
+        dlng = km / max(111.2 * math.cos(math.radians(latitude)), 1e-6)
+
+        south, north = max(latitude - dlat, -90), min(latitude + dlat, 90)
+        west, east = longitude - dlng, longitude + dlng
+
+        # boxes across the antimeridian are split in two
+        if east - west >= 360:
+            boxes = [ (-180, 180) ]
+        elif west < -180:
+            boxes = [ (west + 360, 180), (-180, east) ]
+        elif east > 180:
+            boxes = [ (west, 180), (-180, east - 360) ]
+        else:
+            boxes = [ (west, east) ]
+
+        candidates = itertools.chain.from_iterable(
+            self.within(south, left, north, right) for left, right in boxes
+        )
+
+        for entry in candidates:
+            lat = float(entry.place.latitude)
+            lng = float(entry.place.longitude)
+
+            if _distance_km(latitude, longitude, lat, lng) <= km:
+                yield entry
+
+    #---------------------------------------------------------------------------
+    def _add_lookups(self, entry):
+        self.ids[entry.id] = entry
+
+        # tagged entries are keyed by object, since entries may share an id
+        for tag in entry.tags:
+            self.tags.setdefault(tag, dict())[id(entry)] = entry
+
+        cell = self._cell(entry.place)
+
+        if cell is not None:
+            self.grid.setdefault(cell, list()).append(entry)
+
+    #---------------------------------------------------------------------------
+    def _cell(self, place):
+        if place is None or place.latitude is None or place.longitude is None:
+            return None
+
+        size = EntryIndex.grid_size
+
+        return (
+            math.floor(float(place.latitude) / size),
+            math.floor(float(place.longitude) / size)
+        )
+
+    #---------------------------------------------------------------------------
+    # naive timestamps are local times, as with datetime.now()
+    def _time_key(timestamp):
+        return timestamp.timestamp()
+
+################################################################################
+# finds entries that duplicate one that was already added - entries match on their
+# id, or when they are close in time and have the same text or share a photo
+class DuplicateFinder:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, window=3600):
+        self.window = window
+
+        self.ids = dict()
+        self.texts = dict()
+        self.photos = dict()
+
+    #---------------------------------------------------------------------------
+    def add(self, entry):
+        self.ids[entry.id] = entry
+
+        when = EntryIndex._time_key(entry.timestamp)
+        bucket = int(when // self.window)
+
+        text = DuplicateFinder._text_key(entry)
+
+        if text is not None:
+            self.texts.setdefault((text, bucket), list()).append((when, entry))
+
+        for digest in DuplicateFinder._photo_keys(entry):
+            self.photos.setdefault((digest, bucket), list()).append((when, entry))
+
+    #---------------------------------------------------------------------------
+    # returns the original entry and the reason it matched, or (None, None)
+    def find(self, entry):
+        original = self.ids.get(entry.id)
+
+        if original is not None:
+            return original, 'id'
+
+        when = EntryIndex._time_key(entry.timestamp)
+        text = DuplicateFinder._text_key(entry)
+
+        if text is not None:
+            original = self._nearest(self.texts, text, when)
+
+            if original is not None:
+                return original, 'text'
+
+        for digest in DuplicateFinder._photo_keys(entry):
+            original = self._nearest(self.photos, digest, when)
+
+            if original is not None:
+                return original, 'photos'
+
+        return None, None
+
+    #---------------------------------------------------------------------------
+    # entries within the window are in the same or a neighboring bucket
+    def _nearest(self, table, key, when):
+        bucket = int(when // self.window)
+
+        for neighbor in (bucket, bucket - 1, bucket + 1):
+            for other_when, other in table.get((key, neighbor), ()):
+                if abs(other_when - when) <= self.window:
+                    return other
+
+        return None
+
+    #---------------------------------------------------------------------------
+    # hash of the entry text, ignoring photo references, case and whitespace
+    def _text_key(entry):
+        import hashlib
+
+        text = re.sub(r'!\[[^\]]*\]\(dayone-moment://[^)]*\)', '', entry.markdown())
+        text = ' '.join(text.lower().split())
+
+        if len(text) == 0:
+            return None
+
+        return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+    #---------------------------------------------------------------------------
+    def _photo_keys(entry):
+        return set(
+            photo.digest() for photo in entry.photos if photo.digest() is not None
+        )
+
+################################################################################
+# entries of a journal that are read on demand from the JSON in an archive
+class ArchiveSource:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, filename, arcname):
+        self.filename = filename
+        self.arcname = arcname
+
+        # photo members of the archive, by digest
+        self._media = None
+
+        self.logger = logging.getLogger('dayone.ArchiveSource')
+
+    #---------------------------------------------------------------------------
+    def name(self):
+        header = dict()
+
+        # only reads up to the first entry, so the name must come before them
+        with ZipFile(self.filename, 'r') as myzip:
+            with myzip.open(self.arcname) as fp:
+                elements = iter_json_array(fp, key='entries', header=header)
+                next(elements, None)
+                elements.close()
+
+        return header.get('name')
+
+    #---------------------------------------------------------------------------
+    def data(self):
+        self.logger.debug(f'reading entries: {self.filename} => {self.arcname}')
+
+        with ZipFile(self.filename, 'r') as myzip:
+            with myzip.open(self.arcname) as fp:
+                yield from iter_json_array(fp, key='entries')
+
+    #---------------------------------------------------------------------------
+    def entries(self):
+        for data in self.data():
+            entry = Entry.deserialize(data)
+
+            if len(entry.photos) > 0:
+                Archive._attach_media([ entry ], self.filename, self.media())
+
+            yield entry
+
+    #---------------------------------------------------------------------------
+    # photos of an entry that is passed through as data, read from this archive
+    def photos(self, data):
+        if 'photos' not in data:
+            return list()
+
+        entry = Entry()
+        entry.photos = Entry._deserialize_photos(data['photos'])
+
+        Archive._attach_media([ entry ], self.filename, self.media())
+
+        return entry.photos
+
+    #---------------------------------------------------------------------------
+    def media(self):
+        if self._media is None:
+            with ZipFile(self.filename, 'r') as myzip:
+                self._media = Archive._media_members(myzip)
+
+        return self._media
+
+################################################################################
+# entries of a journal that are stored in several sources, read one after another
+class ChainSource:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, sources=None):
+        self.sources = list()
+        self.current = None
+
+        for source in sources or ():
+            self.add(source)
+
+    #---------------------------------------------------------------------------
+    def add(self, source):
+        if isinstance(source, ChainSource):
+            self.sources.extend(source.sources)
+        else:
+            self.sources.append(source)
+
+    #---------------------------------------------------------------------------
+    def name(self):
+        return self.sources[0].name()
+
+    #---------------------------------------------------------------------------
+    def data(self):
+        for source in self.sources:
+            self.current = source
+            yield from source.data()
+
+    #---------------------------------------------------------------------------
+    # photos of the data that was returned last, which came from the current source
+    def photos(self, data):
+        return self.current.photos(data)
+
+    #---------------------------------------------------------------------------
+    def entries(self):
+        for source in self.sources:
+            yield from source.entries()
+
+################################################################################
+class Entry:
+
+    __slots__ = (
+        '_id', 'title', 'blocks', 'tags', 'place', 'weather', 'photos',
+        '_timestamp', 'timezone'
+    )
+
+    logger = logging.getLogger('dayone.Entry')
+
+    #---------------------------------------------------------------------------
+    def __init__(self, id=None):
+        # the id and timestamp are only generated if they are used before
+        # being set, e.g. not when the entry is deserialized
+        self._id = id
+        self._timestamp = None
+
+        self.title = None
+        self.blocks = list()
+        self.tags = list()
+        self.place = None
+        self.weather = None
+        self.photos = list()
+
+        self.timezone = None
+
+    #---------------------------------------------------------------------------
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = uuid.uuid4()
+
+        return self._id
+
+    #---------------------------------------------------------------------------
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    #---------------------------------------------------------------------------
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = datetime.now()
+
+        return self._timestamp
+
+    #---------------------------------------------------------------------------
+    @timestamp.setter
+    def timestamp(self, value):
+        self._timestamp = value
+
+    #---------------------------------------------------------------------------
+    def __repr__(self):
+        return "Entry(%s)" % (self.id)
+
+    #---------------------------------------------------------------------------
+    # the body is rendered from the blocks each time it is read
+    @property
+    def body(self):
+        if len(self.blocks) == 0:
+            return None
+
+        return '\n'.join(block.markdown() for block in self.blocks)
+
+    #---------------------------------------------------------------------------
+    @body.setter
+    def body(self, text):
+        self.blocks = list()
+
+        if text is not None:
+            self.blocks.append(TextBlock(text))
+
+    #---------------------------------------------------------------------------
+    # add a block to the body - plain strings are added as text blocks
+    def append(self, block):
+        if isinstance(block, str):
+            block = TextBlock(block)
+
+        self.blocks.append(block)
+
+    #---------------------------------------------------------------------------
+    def markdown(self):
+        parts = list()
+
+        if self.title is not None:
+            parts.append(f'# {self.title}\n')
+
+        if len(self.blocks) > 0:
+            parts.append(self.body)
+
+        return ''.join(parts)
+
+    #---------------------------------------------------------------------------
+    def serialize(self):
+        entry = {
+            'uuid' : self.id.hex,
+            'creationDate' : _format_timestamp(self.timestamp),
+            'tags' : self.tags,
+            'text' : self.markdown()
+        }
+
+        if self.place is not None:
+            entry['location'] = self.place.serialize()
+
+        if self.timezone is not None:
+            entry['timeZoneName'] = self.timezone.tzname
+
+        if self.weather is not None:
+            entry['weather'] = self.weather.serialize()
+
+        if len(self.photos) > 0:
+            entry['photos'] = self._serialize_photos()
+
+        # TODO process videos
+
+        return entry
+
+    #---------------------------------------------------------------------------
+    def _serialize_photos(self):
+        data = list()
+
+        for photo in self.photos:
+            photo_data = photo.serialize()
+
+            if photo_data is not None:
+                data.append(photo_data)
+
+        return data
+
+    #---------------------------------------------------------------------------
+    def deserialize(data):
+        entry_id = None
+
+        if 'uuid' in data:
+            entry_id = uuid.UUID(hex=data['uuid'])
+
+        entry = Entry(id=entry_id)
+
+        if 'tags' in data:
+            # tags repeat across most entries, so share a single copy of each
+            entry.tags = [ _intern(tag) for tag in data['tags'] ]
+
+        if 'creationDate' in data:
+            entry.timestamp = _parse_timestamp(data['creationDate'])
+
+        if 'text' in data:
+            # TODO split title if present
+            text = data['text']
+            entry.body = text
+
+        if 'location' in data:
+            entry.place = Place.deserialize(data['location'])
+
+        if 'weather' in data:
+            entry.weather = Weather.deserialize(data['weather'])
+
+        if 'photos' in data:
+            entry.photos = Entry._deserialize_photos(data['photos'])
+
+        # TODO process timeZone
+        # TODO process videos
+
+        return entry
+
+    #---------------------------------------------------------------------------
+    def _deserialize_photos(data):
+        photos = list()
+
+        for photo_data in data:
+            photo = Photo.deserialize(photo_data)
+            if photo is not None:
+                photos.append(photo)
+
+        return photos
+
+################################################################################
+# plain markdown text in the body of an entry
+class TextBlock:
+
+    __slots__ = ('text',)
+
+    #---------------------------------------------------------------------------
+    def __init__(self, text):
+        self.text = text
+
+    #---------------------------------------------------------------------------
+    def markdown(self):
+        return self.text
+
+################################################################################
+# reference to one of the photos attached to an entry
+class PhotoBlock:
+
+    __slots__ = ('photo',)
+
+    #---------------------------------------------------------------------------
+    def __init__(self, photo):
+        self.photo = photo
+
+    #---------------------------------------------------------------------------
+    def markdown(self):
+        return self.photo.markdown()
+
+################################################################################
+# details of a place, rendered from the current state of the Place
+class PlaceBlock:
+
+    __slots__ = ('place',)
+
+    #---------------------------------------------------------------------------
+    def __init__(self, place):
+        self.place = place
+
+    #---------------------------------------------------------------------------
+    def markdown(self):
+        return self.place.markdown()
+
+################################################################################
+# link to an external URL, with an optional name
+class LinkBlock:
+
+    __slots__ = ('url', 'name')
+
+    #---------------------------------------------------------------------------
+    def __init__(self, url, name=None):
+        self.url = url
+        self.name = name
+
+    #---------------------------------------------------------------------------
+    def markdown(self):
+        if self.name is None:
+            return f'<{self.url}>'
+
+        return f'[{self.name}]({self.url})'
+
+################################################################################
+class Media:
+
+    __slots__ = ('_id', 'caption', 'timestamp')
+
+    logger = logging.getLogger('dayone.Media')
+
+    #---------------------------------------------------------------------------
+    def __init__(self, id=None):
+        # generated on first use, like Entry.id
+        self._id = id
+
+        self.caption = None
+        self.timestamp = None
+
+    #---------------------------------------------------------------------------
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = uuid.uuid4()
+
+        return self._id
+
+    #---------------------------------------------------------------------------
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    #---------------------------------------------------------------------------
+    def markdown(self):
+        if self.caption is None:
+            return f'![](dayone-moment://{self.id.hex})'
+
+        return f'![{self.caption}](dayone-moment://{self.id.hex})'
+
+################################################################################
+# a media file stored in a zip archive, e.g. an unextracted service export - these
+# may be used in place of a file path for photos
+class ZipMember:
+
+    __slots__ = ('archive', 'name')
+
+    #---------------------------------------------------------------------------
+    def __init__(self, archive, name):
+        self.archive = archive
+        self.name = name
+
+    #---------------------------------------------------------------------------
+    def __str__(self):
+        return f'{self.archive}!{self.name}'
+
+    #---------------------------------------------------------------------------
+    def __repr__(self):
+        return f'ZipMember({self.archive!r}, {self.name!r})'
+
+    #---------------------------------------------------------------------------
+    def __eq__(self, other):
+        if not isinstance(other, ZipMember):
+            return NotImplemented
+
+        return self.archive == other.archive and self.name == other.name
+
+    #---------------------------------------------------------------------------
+    def __hash__(self):
+        return hash((self.archive, self.name))
+
+    #---------------------------------------------------------------------------
+    def info(self):
+        return _get_zip_archive(self.archive).getinfo(self.name)
+
+    #---------------------------------------------------------------------------
+    def open(self):
+        return _get_zip_archive(self.archive).open(self.name)
+
+################################################################################
+# TODO add support for remote photos, e.g. specify using path or uri
+class Photo(Media):
+
+    __slots__ = ('path', 'name', '_digest')
+
+    logger = logging.getLogger('dayone.Photo')
+
+    #---------------------------------------------------------------------------
+    def __init__(self, path, id=None):
+        Media.__init__(self, id=id)
+
+        self.path = path
+        self.name = None
+
+        # computed on first use by digest()
+        self._digest = None
+
+        self.logger.debug(f'New photo: {self.path}')
+
+    #---------------------------------------------------------------------------
+    @profiled('photo.digest')
+    def digest(self):
+        if self._digest is not None:
+            return self._digest
+
+        if self.path is None:
+            return None
+
+        digest = _indexed_digest(self.path)
+
+        if digest is None:
+            digest = _file_digest(self.path)
+            _index_digest(self.path, digest)
+
+        self._digest = digest
+
+        return self._digest
+
+    #---------------------------------------------------------------------------
+    def serialize(self):
+        data = {
+            'identifier' : self.id.hex,
+            'title' : self.caption,
+            'md5' : self.digest()
+        }
+
+        if self.timestamp is not None:
+            data['date'] = _format_timestamp(self.timestamp)
+
+        return data
+
+    #---------------------------------------------------------------------------
+    def deserialize(data):
+        photo_id = None
+
+        if 'identifier' in data:
+            photo_id = uuid.UUID(hex=data['identifier'])
+
+        photo = Photo(path=None, id=photo_id)
+
+        # TODO need to store and deserialize the photo name
+        if 'file_reference' in data:
+            photo.name = data['file_reference']
+
+        if 'md5' in data:
+            photo._digest = data['md5']
+
+        if 'title' in data:
+            photo.caption = data['title']
+
+        if 'date' in data:
+            photo.timestamp = _parse_timestamp(data['date'])
+
+        return photo
+
+################################################################################
+class Place:
+
+    # TODO add timeZone support
+    # http://api.geonames.org/timezone?lat=47.01&lng=10.2&username=demo
+
+    __slots__ = ('name', 'city', 'state', 'country', 'longitude', 'latitude')
+
+    logger = logging.getLogger('dayone.Place')
+
+    # geocoding function used by lookup - defaults to mapbox_provider
+    provider = None
+
+    #---------------------------------------------------------------------------
+    def __init__(self):
+        self.name = None
+        self.city = None
+        self.state = None
+        self.country = None
+        self.longitude = None
+        self.latitude = None
+
+    #---------------------------------------------------------------------------
+    # TODO apply rate limit to API calls - https://docs.mapbox.com/api/#rate-limits
+    @profiled('place.lookup')
+    def lookup(query, reverse=False, provider=None):
+        cache = _get_geocache()
+        key = None
+
+        if cache is not None:
+            key = cache.key(query, reverse=reverse)
+            data = cache.get(key)
+
+            if data is not None:
+                Place.logger.debug(f'> cached: {key}')
+                return Place.deserialize(data)
+
+        if provider is None:
+            provider = Place.provider
+
+        if provider is None:
+            provider = mapbox_provider
+
+        place = provider(query, reverse=reverse)
+
+        if cache is not None and place is not None:
+            cache.put(key, place.serialize())
+
+        return place
+
+    #---------------------------------------------------------------------------
+    def markdown(self):
+        text = ''
+
+        if self.name is not None:
+            text += f'## {self.name}\n'
+
+        location = ', '.join(filter(None, (self.city, self.state, self.country)))
+        if location is not None and len(location) > 0:
+            text += location + '\n'
+
+        if self.latitude is not None and self.longitude is not None:
+            text += f'GPS: {self.latitude}, {self.longitude}'
+
+        return text
+
+    #---------------------------------------------------------------------------
+    def serialize(self):
+        return {
             'placeName' : self.name,
             'latitude' : self.latitude,
             'longitude' : self.longitude,
 
-            'localityName' : self.city,
-            'administrativeArea' : self.state,
-            'country' : self.country,
+            'localityName' : self.city,
+            'administrativeArea' : self.state,
+            'country' : self.country,
+
+            # TODO confirm we need this section
+            'region' : {
+                'identifier' : self.name,
+                'radius' : 75,
+                'center' : {
+                    'latitude' : self.latitude,
+                    'longitude' : self.longitude,
+                }
+            }
+        }
+
+    #---------------------------------------------------------------------------
+    def deserialize(data):
+        place = Place()
+
+        if 'placeName' in data:
+            place.name = data['placeName']
+
+        if 'localityName' in data:
+            place.city = _intern(data['localityName'])
+
+        if 'administrativeArea' in data:
+            place.state = _intern(data['administrativeArea'])
+
+        if 'country' in data:
+            place.country = _intern(data['country'])
+
+        if 'latitude' in data and 'longitude' in data:
+            place.latitude = data['latitude']
+            place.longitude = data['longitude']
+
+        return place
+
+################################################################################
+# default geocoding provider - looks up places using Mapbox
+def mapbox_provider(query, reverse=False):
+    import geocoder
+
+    place = Place()
+
+    place.logger.debug(f'Looking up place (reverse:{reverse}) -- {query}')
+
+    # TODO use the provider preference from the config
+    api_key = get_config()['mapbox']['key']
+
+    if reverse is True:
+        loc = geocoder.mapbox(query, method='reverse', key=api_key)
+    else:
+        loc = geocoder.mapbox(query, key=api_key)
+
+    place.logger.debug(f'> result: {loc}')
+
+    # failed lookups are not places, and must not end up in the cache
+    if not loc.ok:
+        place.logger.warning(f'Place lookup failed: {query} -- {loc.status}')
+        return None
+
+    place.name = loc.address
+    place.latitude = loc.lat
+    place.longitude = loc.lng
+    place.city = loc.city
+    place.state = loc.state
+    place.country = loc.country
+
+    return place
+
+################################################################################
+# persistent cache of geocoding results, stored in a local SQLite database
+class GeoCache:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, path, ttl=None, max_entries=None, precision=4):
+        import sqlite3
+        import threading
+
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.precision = precision
+
+        self.logger = logging.getLogger('dayone.GeoCache')
+        self.logger.debug(f'Opening geocoding cache: {path}')
+
+        # the cache may be shared by the GeoScheduler worker threads
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS places ('
+            ' key TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' accessed REAL NOT NULL)'
+        )
+        self.db.commit()
+
+    #---------------------------------------------------------------------------
+    def key(self, query, reverse=False):
+        return _geocode_key(query, reverse=reverse, precision=self.precision)
+
+    #---------------------------------------------------------------------------
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT data, created FROM places WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            data, created = row
+            now = time.time()
+
+            if self.ttl is not None and created + self.ttl < now:
+                self.logger.debug(f'cache entry expired: {key}')
+                self.db.execute('DELETE FROM places WHERE key = ?', (key,))
+                self.db.commit()
+                return None
+
+            self.db.execute('UPDATE places SET accessed = ? WHERE key = ?', (now, key))
+            self.db.commit()
+
+        return json.loads(data)
+
+    #---------------------------------------------------------------------------
+    def put(self, key, data):
+        now = time.time()
+
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO places (key, data, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(data), now, now)
+            )
+
+            self._evict()
+            self.db.commit()
+
+    #---------------------------------------------------------------------------
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    #---------------------------------------------------------------------------
+    def _evict(self):
+        if self.max_entries is None:
+            return
+
+        count = self.db.execute('SELECT COUNT(*) FROM places').fetchone()[0]
+
+        if count <= self.max_entries:
+            return
+
+        # drop the least recently used entries
+        self.logger.debug(f'evicting {count - self.max_entries} cache entries')
+
+        self.db.execute(
+            'DELETE FROM places WHERE key IN '
+            '(SELECT key FROM places ORDER BY accessed ASC LIMIT ?)',
+            (count - self.max_entries,)
+        )
+
+################################################################################
+# computes photo digests ahead of time using a pool of worker processes
+class MediaPool:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, workers=None, batch_size=256):
+        import threading
+
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = None
+
+        # digests requested through digest(), by path
+        self.futures = dict()
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('dayone.MediaPool')
+
+    #---------------------------------------------------------------------------
+    def __enter__(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self.workers is not None and self.workers > 0:
+            self.logger.debug(f'starting media pool -- workers: {self.workers}')
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        return self
+
+    #---------------------------------------------------------------------------
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    #---------------------------------------------------------------------------
+    # digest of a single file, safe to call from several threads - each path is
+    # only hashed once, callers asking for the same path wait for the first one
+    def digest(self, path):
+        from concurrent.futures import Future
+
+        with self.lock:
+            future = self.futures.get(path)
+            owner = future is None
+
+            if owner:
+                future = Future()
+                self.futures[path] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            digest = _indexed_digest(path)
+
+            if digest is None:
+                if self.pool is None:
+                    digest = _file_digest(path)
+                else:
+                    start = time.perf_counter()
+                    digest = self.pool.submit(_file_digest, path).result()
+                    MediaPool._record_hash(path, start)
+
+                _index_digest(path, digest)
+
+        except Exception as err:
+            future.set_exception(err)
+            raise
+
+        future.set_result(digest)
+
+        return digest
+
+    #---------------------------------------------------------------------------
+    def prefetch(self, entries):
+        batch = list()
+
+        for entry in entries:
+            batch.append(entry)
+
+            if len(batch) >= self.batch_size:
+                self.prepare(batch)
+                yield from batch
+                batch = list()
+
+        self.prepare(batch)
+        yield from batch
+
+    #---------------------------------------------------------------------------
+    def prepare(self, entries):
+        if self.pool is None:
+            return
+
+        pending = dict()
+
+        for entry in entries:
+            for photo in entry.photos:
+                if photo._digest is not None or photo.path is None:
+                    continue
+
+                photo._digest = _indexed_digest(photo.path)
+
+                if photo._digest is None:
+                    pending.setdefault(photo.path, list()).append(photo)
+
+        if len(pending) == 0:
+            return
+
+        self.logger.debug(f'hashing {len(pending)} photos')
+
+        paths = list(pending.keys())
+
+        start = time.perf_counter()
+        digests = self.pool.map(_file_digest, paths, chunksize=4)
+
+        # each photo is timed from when the previous digest was received
+        for path, digest in zip(paths, digests):
+            MediaPool._record_hash(path, start)
+            _index_digest(path, digest)
+
+            for photo in pending[path]:
+                photo._digest = digest
+
+            start = time.perf_counter()
+
+    #---------------------------------------------------------------------------
+    # photos hashed by the worker processes are timed here, since the workers do
+    # not report to the profiler of this process
+    def _record_hash(path, start):
+        if profiler is not None:
+            profiler.record('media.hash', start, time.perf_counter())
+            profile_bytes('media.hash', _media_size(path))
+
+################################################################################
+# persistent index of file digests, keyed by path, size and modification time
+class DigestIndex:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, path):
+        import sqlite3
+        import threading
+
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('dayone.DigestIndex')
+        self.logger.debug(f'Opening digest index: {path}')
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS digests ('
+            ' path TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' mtime INTEGER NOT NULL,'
+            ' md5 TEXT NOT NULL)'
+        )
+        self.db.commit()
+
+    #---------------------------------------------------------------------------
+    def get(self, path, size, mtime):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT size, mtime, md5 FROM digests WHERE path = ?', (path,)
+            ).fetchone()
+
+        # the file has changed if the size or mtime are different
+        if row is None or row[0] != size or row[1] != mtime:
+            return None
+
+        return row[2]
+
+    #---------------------------------------------------------------------------
+    def put(self, path, size, mtime, md5):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO digests (path, size, mtime, md5) VALUES (?, ?, ?, ?)',
+                (path, size, mtime, md5)
+            )
+            self.db.commit()
+
+    #---------------------------------------------------------------------------
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+################################################################################
+# resolves geocoding queries in bulk using a pool of worker threads
+class GeoScheduler:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, workers=4, rate=None, burst=1, provider=None):
+        import threading
+
+        self.workers = workers
+        self.provider = provider
+        self.limiter = None
+
+        if rate is not None:
+            self.limiter = RateLimiter(rate, burst=burst)
+
+        self.pending = dict()
+        self.results = dict()
+
+        # queries being resolved by fetch(), by key
+        self.futures = dict()
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('dayone.GeoScheduler')
+
+    #---------------------------------------------------------------------------
+    def add(self, query, reverse=False):
+        key = self._key(query, reverse)
+
+        # skip queries that are already resolved or waiting
+        if key in self.results or key in self.pending:
+            return
+
+        cache = _get_geocache()
+
+        if cache is not None:
+            data = cache.get(key)
+
+            if data is not None:
+                self.results[key] = data
+                return
+
+        self.pending[key] = (query, reverse)
+
+    #---------------------------------------------------------------------------
+    def resolve(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        pending = self.pending
+        self.pending = dict()
+
+        if len(pending) == 0:
+            return 0
+
+        self.logger.info(f'Resolving {len(pending)} places -- workers: {self.workers}')
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                key : pool.submit(Place.lookup, query, reverse, self._provider)
+                for key, (query, reverse) in pending.items()
+            }
+
+            for key, future in futures.items():
+                place = future.result()
+
+                if place is not None:
+                    self.results[key] = place.serialize()
+
+        return len(pending)
+
+    #---------------------------------------------------------------------------
+    # resolve a single query now, for callers that manage their own concurrency -
+    # callers asking for a query that is being resolved wait for the first one
+    def fetch(self, query, reverse=False):
+        from concurrent.futures import Future
+
+        key = self._key(query, reverse)
+
+        with self.lock:
+            if key in self.results:
+                return
+
+            future = self.futures.get(key)
+            owner = future is None
+
+            if owner:
+                future = Future()
+                self.futures[key] = future
+
+        if not owner:
+            future.result()
+            return
+
+        try:
+            place = Place.lookup(query, reverse, self._provider)
+
+        except Exception as err:
+            with self.lock:
+                del self.futures[key]
+
+            future.set_exception(err)
+            raise
+
+        with self.lock:
+            if place is not None:
+                self.results[key] = place.serialize()
+
+            del self.futures[key]
+
+        future.set_result(place)
+
+    #---------------------------------------------------------------------------
+    def lookup(self, query, reverse=False):
+        key = self._key(query, reverse)
+
+        if key in self.results:
+            return Place.deserialize(self.results[key])
+
+        return Place.lookup(query, reverse=reverse, provider=self._provider)
+
+    #---------------------------------------------------------------------------
+    def _key(self, query, reverse):
+        cache = _get_geocache()
+
+        if cache is not None:
+            return cache.key(query, reverse=reverse)
+
+        return _geocode_key(query, reverse=reverse)
+
+    #---------------------------------------------------------------------------
+    def _provider(self, query, reverse=False):
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+        provider = self.provider
+
+        if provider is None:
+            provider = Place.provider
+
+        if provider is None:
+            provider = mapbox_provider
+
+        return provider(query, reverse=reverse)
+
+################################################################################
+# token bucket used to throttle calls to external services
+class RateLimiter:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, rate, burst=1):
+        import threading
+
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    #---------------------------------------------------------------------------
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.updated
+
+                self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
+
+################################################################################
+# runs items from a source through a series of stages on an asyncio event loop -
+# stages are joined by bounded queues and run their work in executors, so slow
+# stages hold back the ones before them rather than buffering the whole source
+class Pipeline:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, source, queue_size=4, batch_size=64):
+        self.source = source
+        self.queue_size = queue_size
+
+        # items are passed between stages in small batches, to limit the overhead
+        # of handing them to the executors
+        self.batch_size = batch_size
+        self.stages = list()
+        self.closed = False
+
+        self.logger = logging.getLogger('dayone.Pipeline')
+
+    #---------------------------------------------------------------------------
+    # add a stage calling func(item) for each item, which returns the item passed to
+    # the next stage - a stage runs up to workers calls at once in the executor
+    def stage(self, name, func, workers=1, executor=None):
+        self.stages.append((name, func, workers, executor))
+
+    #---------------------------------------------------------------------------
+    # items are returned in the order of the source, regardless of the order in
+    # which the stages finish them
+    def __iter__(self):
+        import queue
+        import asyncio
+        import threading
+
+        output = queue.Queue(maxsize=self.queue_size)
+
+        self.closed = False
+
+        thread = threading.Thread(
+            target=asyncio.run, args=(self._run(output),), name='pipeline', daemon=True
+        )
+
+        thread.start()
+
+        kind = None
+
+        try:
+            while kind != 'done':
+                kind, value = output.get()
+
+                if kind == 'error':
+                    raise value
+
+                if kind == 'item':
+                    yield from value
+
+        finally:
+            self.closed = True
+
+            # keep draining the output so the stages can finish when stopped early
+            while kind != 'done' and kind != 'error':
+                kind, value = output.get()
+
+            thread.join()
+
+    #---------------------------------------------------------------------------
+    async def _run(self, output):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        loop = asyncio.get_running_loop()
+
+        queues = [ asyncio.Queue(maxsize=self.queue_size) for stage in self.stages ]
+        queues.append(asyncio.Queue(maxsize=self.queue_size))
+
+        # limits the batches in flight, so the reorder buffer of the last stage is bounded
+        window = asyncio.Semaphore(self.queue_size * (len(self.stages) + 1))
+
+        # generators cannot be resumed from several threads, so the source gets its own
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            tasks = [ asyncio.ensure_future(self._read(reader, queues[0], window)) ]
+
+            for idx, stage in enumerate(self.stages):
+                tasks.append(asyncio.ensure_future(self._stage(idx, queues[idx], queues[idx+1])))
+
+            tasks.append(asyncio.ensure_future(self._collect(queues[-1], output, window)))
+
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+
+            for task in pending:
+                task.cancel()
+
+            errors = [ task.exception() for task in done if task.exception() is not None ]
+
+            if len(errors) > 0:
+                self.closed = True
+                await loop.run_in_executor(None, output.put, ('error', errors[0]))
+
+            else:
+                await loop.run_in_executor(None, output.put, ('done', None))
+
+    #---------------------------------------------------------------------------
+    async def _read(self, reader, outbox, window):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        source = iter(self.source)
+        seq = 0
+
+        while not self.closed:
+            await window.acquire()
+
+            batch = await loop.run_in_executor(reader, self._take, source)
+
+            if len(batch) == 0:
+                break
+
+            await outbox.put((seq, batch))
+            seq += 1
+
+        self.logger.debug(f'read {seq} batches')
+
+        await self._finish(outbox, 0)
+
+    #---------------------------------------------------------------------------
+    async def _stage(self, idx, inbox, outbox):
+        import asyncio
+
+        name, func, workers, executor = self.stages[idx]
+
+        await asyncio.gather(*(
+            self._work(name, func, executor, inbox, outbox) for worker in range(workers)
+        ))
+
+        await self._finish(outbox, idx + 1)
+
+    #---------------------------------------------------------------------------
+    async def _work(self, name, func, executor, inbox, outbox):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await inbox.get()
+
+            if item is None:
+                break
 
-            # TODO confirm we need this section
-            'region' : {
-                'identifier' : self.name,
-                'radius' : 75,
-                'center' : {
-                    'latitude' : self.latitude,
-                    'longitude' : self.longitude,
-                }
-            }
-        }
+            seq, batch = item
+            batch = await loop.run_in_executor(executor, self._apply, name, func, batch)
+
+            await outbox.put((seq, batch))
 
     #---------------------------------------------------------------------------
-    def deserialize(data):
-        place = Place()
+    def _take(self, source):
+        batch = list()
 
-        if 'placeName' in data:
-            place.name = data['placeName']
+        for item in source:
+            batch.append(item)
 
-        if 'localityName' in data:
-            place.city = data['localityName']
+            if len(batch) >= self.batch_size:
+                break
 
-        if 'administrativeArea' in data:
-            place.state = data['administrativeArea']
+        return batch
 
-        if 'country' in data:
-            place.country = data['country']
+    #---------------------------------------------------------------------------
+    def _apply(self, name, func, batch):
+        results = list()
 
-        if 'latitude' in data and 'longitude' in data:
-            place.latitude = data['latitude']
-            place.longitude = data['longitude']
+        for item in batch:
+            start = time.perf_counter()
+            results.append(func(item))
 
-        return place
+            if profiler is not None:
+                profiler.record(f'pipeline.{name}', start, time.perf_counter())
+
+        return results
+
+    #---------------------------------------------------------------------------
+    # signal the end of the items to each worker of a stage
+    async def _finish(self, outbox, idx):
+        workers = 1
+
+        if idx < len(self.stages):
+            workers = self.stages[idx][2]
+
+        for worker in range(workers):
+            await outbox.put(None)
+
+    #---------------------------------------------------------------------------
+    async def _collect(self, inbox, output, window):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        pending = dict()
+        next_seq = 0
+
+        while True:
+            item = await inbox.get()
+
+            if item is None:
+                break
+
+            seq, value = item
+            pending[seq] = value
+
+            while next_seq in pending:
+                value = pending.pop(next_seq)
+                await loop.run_in_executor(None, output.put, ('item', value))
+
+                next_seq += 1
+                window.release()
 
 ################################################################################
 # XXX this is still mostly a stub...
 class Weather:
 
+    __slots__ = ('conditions', 'temperature')
+
+    logger = logging.getLogger('dayone.Weather')
+
     #---------------------------------------------------------------------------
     def __init__(self):
         self.conditions = None
         self.temperature = None
 
-        self.logger = logging.getLogger('dayone.Weather')
-
     #---------------------------------------------------------------------------
     def serialize(self):
         return {
@@ -520,6 +2605,14 @@ class Weather:
 
         return wx
 
+################################################################################
+# utility method for sharing a single copy of frequently repeated strings
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+
+    return value
+
 ################################################################################
 # utility method for formatting timestamps
 def _format_timestamp(timestamp):
@@ -527,18 +2620,571 @@ def _format_timestamp(timestamp):
         return None
 
     # Day One expects UTC timestamps
-    timestamp = timestamp.astimezone(tz=timezone.utc)
+    if timestamp.tzinfo is not timezone.utc:
+        timestamp = timestamp.astimezone(tz=timezone.utc)
 
-    return timestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
+    # equivalent to strftime('%Y-%m-%dT%H:%M:%SZ'), but much faster
+    return (
+        f'{timestamp.year:04d}-{timestamp.month:02d}-{timestamp.day:02d}T'
+        f'{timestamp.hour:02d}:{timestamp.minute:02d}:{timestamp.second:02d}Z'
+    )
 
 ################################################################################
-# utility method for parsing timestamps
+# utility method for parsing timestamps - entries and their photos often share
+# the same timestamp, so recent results are cached
+@functools.lru_cache(maxsize=1024)
 def _parse_timestamp(timestamp):
+
+    # fast path for the fixed Day One format, e.g. 2020-06-18T12:34:56Z
+    if len(timestamp) == 20 and timestamp[10] == 'T' and timestamp[19] == 'Z':
+        try:
+            ts = datetime.fromisoformat(timestamp[:19])
+            return ts.replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+
     ts = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ')
     ts = ts.replace(tzinfo=timezone.utc)
 
     return ts
 
+################################################################################
+# JSON serializer backed by the fastest available library - all backends read
+# and write bytes, so documents are not copied through intermediate strings
+class JsonBackend:
+
+    # in order of preference when the backend is 'auto'
+    names = ('orjson', 'ujson', 'simdjson', 'json')
+
+    #---------------------------------------------------------------------------
+    def __init__(self, name='auto'):
+        import importlib
+
+        # whether the backend was chosen, rather than found by preference
+        self.explicit = name != 'auto'
+
+        if name == 'auto':
+            for name in self.names:
+                try:
+                    importlib.import_module(name)
+                    break
+                except ImportError:
+                    pass
+
+        if name not in self.names:
+            raise ValueError(f'unknown JSON backend: {name}')
+
+        self.name = name
+        self.module = importlib.import_module(name)
+
+        # orjson only supports indenting with two spaces
+        self.indent = 2 if name == 'orjson' else 4
+
+        logging.getLogger('dayone.JsonBackend').debug(f'using JSON backend: {name}')
+
+    #---------------------------------------------------------------------------
+    def loads(self, data):
+        return self.module.loads(data)
+
+    #---------------------------------------------------------------------------
+    def dumps(self, obj, pretty=False):
+        if self.name == 'orjson':
+            option = self.module.OPT_INDENT_2 if pretty else 0
+            return self.module.dumps(obj, option=option)
+
+        if self.name == 'ujson':
+            text = self.module.dumps(
+                obj, indent=self.indent if pretty else 0,
+                ensure_ascii=False, escape_forward_slashes=False
+            )
+            return text.encode('utf-8')
+
+        # simdjson only parses, so it writes with the standard library
+        if pretty:
+            return json.dumps(obj, indent=self.indent).encode('utf-8')
+
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+################################################################################
+# reads JSON values incrementally from a text stream
+class JsonStream:
+
+    whitespace = re.compile(r'[ \t\n\r]*')
+
+    # characters that continue a number, e.g. when a chunk ends after "1." or "1e"
+    number_chars = frozenset('0123456789.eE+-')
+
+    #---------------------------------------------------------------------------
+    def __init__(self, fp, chunk_size=64*1024):
+        if not isinstance(fp, io.TextIOBase):
+            fp = io.TextIOWrapper(fp, encoding='utf-8')
+
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    #---------------------------------------------------------------------------
+    def peek(self):
+        while True:
+            self.pos = self.whitespace.match(self.buf, self.pos).end()
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self._fill():
+                return ''
+
+    #---------------------------------------------------------------------------
+    def expect(self, chars):
+        char = self.peek()
+
+        if char == '' or char not in chars:
+            raise ValueError(f'invalid JSON stream: expected {chars!r}, found {char!r}')
+
+        self.pos += 1
+
+        return char
+
+    #---------------------------------------------------------------------------
+    def value(self):
+        self.peek()
+
+        while True:
+            end = None
+
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            # a value ending with the buffer may continue in the next chunk
+            if end is not None and (self.eof or (end < len(self.buf) and not self._partial(value, end))):
+                self.pos = end
+                return value
+
+            self._fill()
+
+    #---------------------------------------------------------------------------
+    def array(self):
+        self.expect('[')
+
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        while True:
+            yield self.value()
+
+            if self.expect(',]') == ']':
+                return
+
+    #---------------------------------------------------------------------------
+    # numbers are decoded up to the last valid prefix, so one followed by a
+    # character that continues a number was cut off at the end of the buffer
+    def _partial(self, value, end):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+
+        return self.buf[end] in self.number_chars
+
+    #---------------------------------------------------------------------------
+    def _fill(self):
+        chunk = self.fp.read(self.chunk_size)
+
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+        return True
+
+################################################################################
+# read the elements of a JSON array one at a time from the given stream - when
+# key is set, the array is read from that key of the top-level object and the
+# other top-level values are collected in header
+def iter_json_array(fp, key=None, header=None):
+    stream = JsonStream(fp)
+
+    if key is None:
+        yield from stream.array()
+        return
+
+    stream.expect('{')
+
+    if stream.peek() == '}':
+        return
+
+    while True:
+        name = stream.value()
+        stream.expect(':')
+
+        if name == key:
+            yield from stream.array()
+
+        else:
+            value = stream.value()
+
+            if header is not None:
+                header[name] = value
+
+        if stream.expect(',}') == '}':
+            return
+
+################################################################################
+# shards being saved by save_shards, shared with the worker processes
+shard_jobs = None
+
+# utility method for saving a shard, run in worker processes by save_shards
+def _save_shard(idx):
+    archive, filename = shard_jobs[idx]
+    archive.save(filename)
+    return archive.stats
+
+#-------------------------------------------------------------------------------
+def _can_fork():
+    import multiprocessing
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+################################################################################
+# utility method for computing the MD5 digest of a file in fixed size chunks
+@profiled('media.hash')
+def _file_digest(path, chunk_size=1024*1024):
+    import hashlib
+
+    md5 = hashlib.md5()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    total = 0
+
+    with _open_media(path) as infile:
+        while True:
+            count = infile.readinto(buf)
+
+            if not count:
+                break
+
+            md5.update(view[:count])
+            total += count
+
+    profile_bytes('media.hash', total)
+
+    return md5.hexdigest()
+
+################################################################################
+# utility method for finding a file digest in the persistent index
+def _indexed_digest(path):
+    index = _get_digest_index()
+
+    if index is None:
+        return None
+
+    return index.get(*_media_key(path))
+
+################################################################################
+# utility method for saving a file digest in the persistent index
+def _index_digest(path, digest):
+    index = _get_digest_index()
+
+    if index is None:
+        return
+
+    index.put(*_media_key(path), digest)
+
+################################################################################
+# utility method for opening a media file or archive member for reading
+def _open_media(path):
+    if isinstance(path, ZipMember):
+        return path.open()
+
+    return open(path, 'rb')
+
+################################################################################
+# utility method for the extension of a media file or archive member in an archive -
+# JPEG photos are named .jpeg, as Day One does, which is also used when there is none
+def _media_ext(path):
+    name = path.name if isinstance(path, ZipMember) else os.fspath(path)
+    ext = os.path.splitext(name)[1].lower()
+
+    if ext == '.jpg' or re.fullmatch(r'\.\w+', ext) is None:
+        return '.jpeg'
+
+    return ext
+
+################################################################################
+# utility method for the uncompressed size of a media file or archive member
+def _media_size(path):
+    if isinstance(path, ZipMember):
+        return path.info().file_size
+
+    return os.path.getsize(path)
+
+################################################################################
+# utility method for the digest index key, size and modification time of a media
+# file - archive members are considered changed when the archive is modified
+def _media_key(path):
+    if isinstance(path, ZipMember):
+        archive = os.path.abspath(path.archive)
+        stat = os.stat(archive)
+
+        return f'{archive}!{path.name}', path.info().file_size, stat.st_mtime_ns
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+
+    return path, stat.st_size, stat.st_mtime_ns
+
+################################################################################
+# utility method for the great-circle distance between two points
+def _distance_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+################################################################################
+# utility method for building geocoding cache keys
+def _geocode_key(query, reverse=False, precision=4):
+    if reverse is True:
+        # quantize coordinates so nearby points share a cache entry
+        lat, lng = (round(float(value), precision) for value in query)
+        return f'reverse:{lat:.{precision}f},{lng:.{precision}f}'
+
+    # normalize case and whitespace of forward queries
+    query = ' '.join(str(query).lower().split())
+    return f'forward:{query}'
+
+################################################################################
+# the shared geocoding cache, created from the config on first use
+geocache = None
+
+def _get_geocache():
+    global geocache
+
+    if geocache is not None:
+        return geocache
+
+    opts = get_config().get('geocache') or dict()
+
+    if opts.get('enabled', True) is False:
+        return None
+
+    geocache = GeoCache(
+        opts.get('path', 'geocache.db'),
+        ttl=opts.get('ttl', 90 * 24 * 60 * 60),
+        max_entries=opts.get('max_entries', 100000),
+        precision=opts.get('precision', 4)
+    )
+
+    return geocache
+
+################################################################################
+# archives holding media files, opened once since reading the central directory of
+# a large export is slow - forked worker processes open their own file handles
+zip_archives = dict()
+zip_archives_pid = None
+
+def _get_zip_archive(path):
+    global zip_archives, zip_archives_pid
+
+    if zip_archives_pid != os.getpid():
+        zip_archives = dict()
+        zip_archives_pid = os.getpid()
+
+    archive = zip_archives.get(path)
+
+    if archive is None:
+        archive = ZipFile(path, 'r')
+        zip_archives[path] = archive
+
+    return archive
+
+################################################################################
+# timers and counters for the stages of an import, with optional output for the
+# standard library profiler and Chrome's trace viewer (chrome://tracing)
+class Profiler:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, pstats=None, trace=None):
+        import threading
+
+        self.pstats = pstats
+        self.trace = trace
+
+        # stage name => [calls, seconds, bytes]
+        self.stages = dict()
+        self.events = list()
+
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.cprofile = None
+
+        self.logger = logging.getLogger('dayone.Profiler')
+
+    #---------------------------------------------------------------------------
+    def start(self):
+        global profiler
+
+        if self.pstats is not None:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+        self.origin = time.perf_counter()
+        profiler = self
+
+    #---------------------------------------------------------------------------
+    def stop(self):
+        global profiler
+
+        profiler = None
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.pstats)
+            self.logger.info(f'saved profile stats: {self.pstats}')
+
+        if self.trace is not None:
+            self.write_trace(self.trace)
+
+    #---------------------------------------------------------------------------
+    def record(self, stage, start, end):
+        with self.lock:
+            stats = self.stages.setdefault(stage, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += end - start
+
+            if self.trace is not None:
+                import threading
+
+                self.events.append({
+                    'name' : stage,
+                    'ph' : 'X',
+                    'ts' : (start - self.origin) * 1e6,
+                    'dur' : (end - start) * 1e6,
+                    'pid' : os.getpid(),
+                    'tid' : threading.get_ident()
+                })
+
+    #---------------------------------------------------------------------------
+    def add_bytes(self, stage, count):
+        with self.lock:
+            stats = self.stages.setdefault(stage, [0, 0.0, 0])
+            stats[2] += count
+
+    #---------------------------------------------------------------------------
+    def report(self, out=sys.stderr):
+        print(f'{"stage":<24} {"calls":>8} {"total (s)":>10} {"mean (ms)":>10} {"bytes":>14}', file=out)
+
+        # stages are nested, so the totals include the time of their inner stages
+        for stage, (calls, seconds, count) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            mean = seconds / calls * 1000 if calls > 0 else 0
+            print(f'{stage:<24} {calls:>8} {seconds:>10.3f} {mean:>10.3f} {count:>14}', file=out)
+
+    #---------------------------------------------------------------------------
+    def write_trace(self, path):
+        with open(path, 'w') as fp:
+            json.dump({ 'traceEvents' : self.events }, fp)
+
+        self.logger.info(f'saved trace: {path} ({len(self.events)} events)')
+
+################################################################################
+# the persistent digest index, only used when enabled in the config
+digest_index = None
+
+def _get_digest_index():
+    global digest_index
+
+    if digest_index is not None:
+        return digest_index
+
+    config = get_config()
+
+    if 'digests' not in config:
+        return None
+
+    opts = config['digests'] or dict()
+
+    if opts.get('enabled', True) is False:
+        return None
+
+    digest_index = DigestIndex(opts.get('path', 'digests.db'))
+
+    return digest_index
+
+################################################################################
+# the JSON backend used for archive I/O, selected by the config unless set
+json_backend = None
+
+def get_json_backend():
+    global json_backend
+
+    if json_backend is None:
+        opts = get_config().get('json') or dict()
+        json_backend = JsonBackend(opts.get('backend', 'auto'))
+
+    return json_backend
+
+#-------------------------------------------------------------------------------
+def set_json_backend(name):
+    global json_backend
+
+    json_backend = JsonBackend(name)
+
+    return json_backend
+
+################################################################################
+# create a compression policy using the settings from the config
+def new_compression_policy(method=None):
+    opts = get_config().get('compression') or dict()
+
+    if method is None:
+        method = opts.get('json', 'deflate')
+
+    return CompressionPolicy(
+        method=method,
+        level=opts.get('level', 6),
+        media=opts.get('media', 'deflate')
+    )
+
+################################################################################
+# create a geocoding scheduler using the settings from the config
+def new_geo_scheduler():
+    opts = get_config().get('geocoding') or dict()
+
+    return GeoScheduler(
+        workers=opts.get('workers', 4),
+        rate=opts.get('rate', 10),
+        burst=opts.get('burst', 1)
+    )
+
+################################################################################
+# dates from the command line are in UTC, like the entry timestamps
+def _parse_date(text):
+    value = datetime.fromisoformat(text)
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    return value
+
+################################################################################
+# create a profiler for the --profile options of a command line
+def new_profiler(args):
+    if not args.profile and args.profile_stats is None and args.profile_trace is None:
+        return None
+
+    return Profiler(pstats=args.profile_stats, trace=args.profile_trace)
+
 ################################################################################
 def main():
     import argparse
@@ -546,30 +3192,127 @@ def main():
     argp = argparse.ArgumentParser()
     argp.add_argument('--load', help='file to read import data')
     argp.add_argument('--save', help='file to write export data')
-    #argp.add_argument('--config', help='use specified config file', default='dayone.yaml')
+    argp.add_argument('--update', help='existing archive to add the loaded journals to')
+    argp.add_argument('--merge', nargs='+', help='archives to merge into the loaded one, skipping duplicate entries')
+    argp.add_argument('--report', help='file to write the merge report')
+    argp.add_argument('--window', type=int, default=3600, help='seconds between entries that may be duplicates')
+    argp.add_argument('--shard', choices=('count', 'bytes', 'year'), help='split the saved archive into several archives')
+    argp.add_argument('--shard-size', type=int, default=10000, help='entries or bytes in each shard')
+    argp.add_argument('--compact', action='store_true', help='write journal data without indentation')
+    argp.add_argument('--lazy', action='store_true', help='read journal entries on demand')
+    argp.add_argument('--workers', type=int, help='number of processes used to hash photos')
+    argp.add_argument('--compress', choices=CompressionPolicy.methods.keys(), help='compression for journal data')
+    argp.add_argument('--config', help='use specified config file', default='dayone.yaml')
+    argp.add_argument('--json', choices=('auto',) + JsonBackend.names, help='JSON library for archive data')
+    argp.add_argument('--format', choices=('yaml', 'jsonl', 'ndjson'), default='yaml', help='output format when dumping entries')
+    argp.add_argument('--since', type=_parse_date, help='only dump entries from this date (YYYY-MM-DD)')
+    argp.add_argument('--until', type=_parse_date, help='only dump entries before this date (YYYY-MM-DD)')
+    argp.add_argument('--tag', action='append', help='only dump entries with this tag (may be repeated)')
+    argp.add_argument('--limit', type=int, help='maximum number of entries to dump')
+    argp.add_argument('--profile', action='store_true', help='print the time spent in each stage')
+    argp.add_argument('--profile-stats', help='save cProfile stats to the given file')
+    argp.add_argument('--profile-trace', help='save a Chrome trace of the stages to the given file')
     args = argp.parse_args()
 
+    load_config(args.config)
+
+    if args.json is not None:
+        set_json_backend(args.json)
+
+    stages = new_profiler(args)
+
+    if stages is not None:
+        stages.start()
+
     archive = None
 
+    # dumping only reads the entries once, so they are read as they are written
+    dumping = args.save is None and args.update is None
+    lazy = args.lazy or (dumping and args.merge is None)
+
     if args.load is not None:
-        archive = Archive.load(args.load)
+        archive = Archive.load(args.load, lazy=lazy)
+
+    if args.merge is not None:
+        reports = [
+            archive.merge(Archive.load(filename, lazy=args.lazy), window=args.window)
+            for filename in args.merge
+        ]
+
+        if args.report is not None:
+            with open(args.report, 'w') as fp:
+                json.dump(dict(zip(args.merge, reports)), fp, indent=4)
+
+    if args.update is not None:
+        target = Archive.load(args.update, lazy=True)
+        changed = target.merge_entries(archive)
+
+        target.compact = args.compact
+        target.workers = args.workers
+        target.compression = new_compression_policy(args.compress)
+        target.update(args.update, changed)
+
+    elif args.save is not None:
+        archive.compact = args.compact
+        archive.workers = args.workers
+        archive.compression = new_compression_policy(args.compress)
+
+        if args.shard is not None:
+            archive.save_shards(args.save, by=args.shard, limit=args.shard_size)
+        else:
+            archive.save(args.save)
 
-    if args.save is not None:
-        archive.save(args.save)
     else:
-        archive.dump()
+        archive.dump(format=args.format, since=args.since, until=args.until, tags=args.tag, limit=args.limit)
+
+    if stages is not None:
+        stages.stop()
+
+        if args.profile:
+            stages.report()
 
 ################################################################################
-## load the config file
+## config file - loaded on first use, unless load_config is called explicitly
 
-# TODO improve error handling...
 config = None
+config_file = None
+
+def load_config(path='dayone.yaml'):
+    global config, config_file
+
+    import yaml
+
+    config_file = path
+
+    # prefer the libyaml parser when it is available
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    try:
+        with open(path) as fp:
+            config = yaml.load(fp, Loader=loader)
+
+    except FileNotFoundError:
+        logging.getLogger('dayone').warning(f'config file not found: {path}')
+        config = None
+
+    if config is None:
+        config = dict()
+
+    if 'logging' in config:
+        from logging.config import dictConfig
+
+        # class loggers are created on import, before the config is loaded
+        config['logging'].setdefault('disable_existing_loggers', False)
+        dictConfig(config['logging'])
+
+    return config
 
-with open('dayone.yaml') as fp:
-    config = yaml.load(fp, Loader=yaml.Loader)
+#-------------------------------------------------------------------------------
+def get_config():
+    if config is None:
+        load_config()
 
-if 'logging' in config:
-    logging.config.dictConfig(config['logging'])
+    return config
 
 ################################################################################
 ## MAIN ENTRY
@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
 
+import io
+import os
+import re
 import json
+import uuid
+import heapq
+import hashlib
+import zipfile
 import argparse
 
 from datetime import datetime, timezone
@@ -10,24 +17,595 @@ import dayone
 # TODO character encodings are not correct...
 # https://stackoverflow.com/questions/52747566/what-encoding-facebook-uses-in-json-files-from-data-export
 
+# optional scheduler used to resolve places in bulk before parsing posts
+geo_scheduler = None
+
+# export archives that media files are read from, instead of extracted files
+media_archives = list()
+
+# namespace for deterministic entry ids of imported posts
+FB_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'https://www.facebook.com/')
+
+################################################################################
+# load all entries from the given JSON export(s) from Facebook - the posts are
+# read on demand when the journal is saved, one post at a time
+def load_posts(fb_posts_files, journal, manifest=None, pipeline=False, workers=None):
+    if pipeline is True:
+        source = PostsPipeline(fb_posts_files, manifest=manifest, workers=workers)
+    else:
+        source = PostsSource(fb_posts_files, manifest=manifest)
+
+    # media in posts read from an export archive are read from the same archive
+    for fb_posts_file in source.files:
+        if isinstance(fb_posts_file, dayone.ZipMember) and fb_posts_file.archive not in media_archives:
+            media_archives.append(fb_posts_file.archive)
+
+    # resolve all places up front so lookups are not serialized on the network -
+    # the pipeline resolves them as the posts are read instead
+    if geo_scheduler is not None and pipeline is False:
+        for key, post in source.keyed_posts():
+            collect_fb_places(post, geo_scheduler)
+
+        geo_scheduler.resolve()
+
+    journal.source = source
+
 ################################################################################
-# load all entries from the given JSON export from Facebook
-def load_posts(fb_posts_file, journal):
-    fb_posts = None
+# journal entries that are parsed on demand from Facebook posts files
+class PostsSource:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, fb_posts_files, manifest=None):
+        if isinstance(fb_posts_files, str):
+            fb_posts_files = [ fb_posts_files ]
+
+        self.files = find_posts_files(fb_posts_files)
+
+        # when set, only posts that are new or changed since the last export are used
+        self.manifest = manifest
+
+    #---------------------------------------------------------------------------
+    def posts(self):
+        backend = dayone.get_json_backend()
+
+        for fb_posts_file in self.files:
 
-    with open(fb_posts_file) as fp:
-        fb_posts = json.load(fp)
+            # the standard library parser reads posts incrementally, while a faster
+            # backend parses one whole file at a time - that is only done when the
+            # backend was chosen, since whole files can be large
+            if backend.name == 'json' or not backend.explicit:
+                with dayone._open_media(fb_posts_file) as fp:
+                    yield from dayone.iter_json_array(io.TextIOWrapper(fp, encoding='utf-8'))
 
-    for post in fb_posts:
-        entry = fb_post_as_entry(post)
+            else:
+                yield from read_export_file(fb_posts_file)
+
+    #---------------------------------------------------------------------------
+    def keyed_posts(self):
+        seen = dict()
+
+        for post in self.posts():
+            key = fb_post_key(post, seen)
+
+            if self.manifest is not None:
+                digest = fb_post_digest(post)
+
+                if not self.manifest.changed(key, digest):
+                    continue
+
+                self.manifest.mark(key, digest)
+
+            yield key, post
+
+    #---------------------------------------------------------------------------
+    def entries(self):
+        for keyed_post in self.keyed_posts():
+            yield self.parse(keyed_post)
+
+    #---------------------------------------------------------------------------
+    def parse(self, keyed_post):
+        key, post = keyed_post
+
+        entry = fb_post_as_entry(post, entry_id=uuid.uuid5(FB_NAMESPACE, key))
         entry.tags.append('Facebook')
         entry.tags.append('Facebook-Post')
 
+        return entry
+
+################################################################################
+# posts that are read, geocoded, converted and hashed concurrently, so waiting on
+# the network and on the disk overlap - entries are still returned in export order
+class PostsPipeline(PostsSource):
+
+    #---------------------------------------------------------------------------
+    def __init__(self, fb_posts_files, manifest=None, workers=None):
+        PostsSource.__init__(self, fb_posts_files, manifest=manifest)
+
+        # number of processes used to hash photos
+        self.workers = workers
+
+    #---------------------------------------------------------------------------
+    def entries(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        opts = dayone.get_config().get('pipeline') or dict()
+
+        # concurrent calls per stage, defaulting to the geocoding and hashing workers
+        geo_workers = 4
+        hash_workers = 4
+
+        if geo_scheduler is not None:
+            geo_workers = geo_scheduler.workers
+
+        if self.workers is not None and self.workers > 0:
+            hash_workers = self.workers * 2
+
+        geo_workers = opts.get('geocode', geo_workers)
+        hash_workers = opts.get('hash', hash_workers)
+
+        pipeline = dayone.Pipeline(
+            self.keyed_posts(), queue_size=opts.get('queue', 4), batch_size=opts.get('batch', 64)
+        )
+
+        with ThreadPoolExecutor(max_workers=geo_workers) as geo_pool, \
+             ThreadPoolExecutor(max_workers=hash_workers) as hash_pool, \
+             dayone.MediaPool(self.workers) as media:
+
+            def hash_photos(entry):
+                for photo in entry.photos:
+                    if photo._digest is None and photo.path is not None:
+                        photo._digest = media.digest(photo.path)
+
+                return entry
+
+            pipeline.stage('geocode', self.geocode, workers=geo_workers, executor=geo_pool)
+            pipeline.stage('parse', self.parse)
+            pipeline.stage('hash', hash_photos, workers=hash_workers, executor=hash_pool)
+
+            yield from pipeline
+
+    #---------------------------------------------------------------------------
+    def geocode(self, keyed_post):
+        key, post = keyed_post
+
+        if geo_scheduler is not None:
+            for coord in fb_post_places(post):
+                geo_scheduler.fetch(coord, reverse=True)
+
+        return keyed_post
+
+################################################################################
+@dayone.profiled('facebook.read_export')
+def read_export_file(fb_export_file):
+    with dayone._open_media(fb_export_file) as fp:
+        data = fp.read()
+
+    dayone.profile_bytes('facebook.read_export', len(data))
+
+    return dayone.get_json_backend().loads(data)
+
+################################################################################
+# load posts, album photos and videos from all of the export files at once - the
+# files are converted in a pool of processes when jobs is set, and their entries
+# are added to the journal in timestamp order
+def load_export(journal, posts=(), albums=(), videos=(), manifest=None, jobs=None):
+    files = [ ('posts', path) for path in find_export_files(posts, POSTS_FILES) ]
+    files.extend(('album', path) for path in find_export_files(albums, ALBUM_FILES))
+    files.extend(('videos', path) for path in find_export_files(videos, VIDEOS_FILES))
+
+    # media in files read from an export archive are read from the same archive
+    for kind, path in files:
+        if isinstance(path, dayone.ZipMember) and path.archive not in media_archives:
+            media_archives.append(path.archive)
+
+    args = ([ kind for kind, path in files ], [ path for kind, path in files ])
+    archives = [ list(media_archives) ] * len(files)
+
+    # workers that are not forked start without the settings of this process
+    backend = dayone.get_json_backend()
+    configs = [ dayone.config_file ] * len(files)
+    backends = [ backend.name if backend.explicit else None ] * len(files)
+
+    if jobs is not None and jobs > 1 and len(files) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(jobs, len(files))) as pool:
+            results = list(pool.map(convert_export_file, *args, archives, configs, backends))
+
+    else:
+        results = list(map(convert_export_file, *args, archives, configs, backends))
+
+    resolve_deferred_places(results)
+
+    seen = dict()
+    post_uris = set()
+
+    # posts are numbered across all of the posts files, in the order of the export
+    for result in results:
+        if result['kind'] != 'posts':
+            continue
+
+        keyed = list()
+
+        for key, base, digest, uris, entry in result['items']:
+            count = seen.get(base, 0)
+            seen[base] = count + 1
+
+            final = base if count == 0 else f'{base}:{count}'
+
+            if final != key:
+                rekey_entry(entry, final)
+
+            post_uris.update(uris)
+
+            if manifest is not None:
+                if not manifest.changed(final, digest):
+                    continue
+
+                manifest.mark(final, digest)
+
+            keyed.append(entry)
+
+        result['entries'] = keyed
+
+    # albums and videos mostly repeat media that were shared in posts
+    for result in results:
+        if result['kind'] == 'posts':
+            continue
+
+        keyed = list()
+
+        for key, base, digest, uris, entry in result['items']:
+            if len(post_uris.intersection(uris)) > 0:
+                continue
+
+            if manifest is not None:
+                if not manifest.changed(key, digest):
+                    continue
+
+                manifest.mark(key, digest)
+
+            keyed.append(entry)
+
+        result['entries'] = keyed
+
+    entries = [
+        sorted(result['entries'], key=entry_time) for result in results
+    ]
+
+    count = 0
+
+    for entry in heapq.merge(*entries, key=entry_time):
         journal.add(entry)
+        count += 1
+
+    return count
+
+################################################################################
+# convert one export file to entries, run in a worker process by load_export - the
+# places are looked up afterwards, so workers do not wait on geocoding
+def convert_export_file(kind, fb_export_file, archives, config_file=None, backend=None):
+    global geo_scheduler
+
+    media_archives[:] = archives
+
+    if config_file is not None and dayone.config_file != config_file:
+        dayone.load_config(config_file)
+
+    if backend is not None and dayone.get_json_backend().name != backend:
+        dayone.set_json_backend(backend)
+
+    scheduler = geo_scheduler
+    geo_scheduler = DeferredPlaces()
+
+    items = list()
+
+    try:
+        data = read_export_file(fb_export_file)
+
+        if kind == 'posts':
+            seen = dict()
+
+            for post in data:
+                key = fb_post_key(post, seen)
+                base = fb_post_base_key(post)
+
+                entry = fb_post_as_entry(post, entry_id=uuid.uuid5(FB_NAMESPACE, key))
+                entry.tags.append('Facebook')
+                entry.tags.append('Facebook-Post')
+
+                items.append((key, base, fb_post_digest(post), fb_post_uris(post), entry))
+
+        else:
+            media = data.get('photos', list()) if kind == 'album' \
+                else data.get('videos', data.get('videos_v2', list()))
+
+            tag = 'Facebook-Album' if kind == 'album' else 'Facebook-Video'
+
+            for fb_media in media:
+                key = f'{kind}:{fb_media["uri"]}'
+
+                entry = fb_media_as_entry(fb_media, entry_id=uuid.uuid5(FB_NAMESPACE, key))
+                entry.tags.append('Facebook')
+                entry.tags.append(tag)
+
+                items.append((key, key, fb_post_digest(fb_media), [ fb_media['uri'] ], entry))
+
+        places = geo_scheduler.places
+
+    finally:
+        geo_scheduler = scheduler
+
+    return { 'kind' : kind, 'items' : items, 'places' : places }
+
+################################################################################
+# stands in for the geocoding scheduler while converting export files - lookups
+# return a place with only coordinates, which is filled in once it is resolved
+class DeferredPlaces:
+
+    #---------------------------------------------------------------------------
+    def __init__(self):
+        self.places = list()
+
+    #---------------------------------------------------------------------------
+    def lookup(self, query, reverse=False):
+        place = query_place(query, reverse=reverse)
+
+        self.places.append((query, reverse, place))
+
+        return place
+
+################################################################################
+# resolve the places of converted export files, updating the entries in place
+def resolve_deferred_places(results):
+    scheduler = geo_scheduler
+
+    if scheduler is None:
+        scheduler = dayone.GeoScheduler()
+
+    for result in results:
+        for query, reverse, place in result['places']:
+            scheduler.add(query, reverse=reverse)
+
+    scheduler.resolve()
+
+    for result in results:
+        for query, reverse, place in result['places']:
+            resolved = scheduler.lookup(query, reverse=reverse)
+
+            # places that cannot be resolved keep their coordinates, as with lookup_place
+            if resolved is None:
+                continue
+
+            # names from the export are kept over the geocoded name
+            if place.name is None:
+                place.name = resolved.name
+
+            place.city = resolved.city
+            place.state = resolved.state
+            place.country = resolved.country
+            place.latitude = resolved.latitude
+            place.longitude = resolved.longitude
+
+################################################################################
+# give a post a different key, when it shares a timestamp with posts in other files
+def rekey_entry(entry, key):
+    entry.id = uuid.uuid5(FB_NAMESPACE, key)
+
+    # photo ids are derived from the entry id, as in parse_fb_media
+    for idx, photo in enumerate(entry.photos):
+        uri = photo.path.name if isinstance(photo.path, dayone.ZipMember) else photo.path
+        photo.id = uuid.uuid5(entry.id, f'{idx}:{uri}')
+
+################################################################################
+def entry_time(entry):
+    return entry.timestamp.timestamp()
+
+################################################################################
+# uris of the media attached to a post
+def fb_post_uris(fb_post):
+    uris = list()
+
+    for attachment in fb_post.get('attachments', ()):
+        for data in attachment['data']:
+            if 'media' in data and 'uri' in data['media']:
+                uris.append(data['media']['uri'])
+
+    for data in fb_post.get('data', ()):
+        if 'media' in data and 'uri' in data['media']:
+            uris.append(data['media']['uri'])
+
+    return uris
+
+################################################################################
+# record of the posts that were already exported, used for incremental imports
+class Manifest:
+
+    #---------------------------------------------------------------------------
+    def __init__(self, path):
+        self.path = path
+
+        # posts in the last saved export, and posts included in this one
+        self.exported = dict()
+        self.pending = dict()
+
+        if os.path.exists(path):
+            with open(path) as fp:
+                self.exported = json.load(fp)
+
+    #---------------------------------------------------------------------------
+    def changed(self, key, digest):
+        return self.exported.get(key) != digest
+
+    #---------------------------------------------------------------------------
+    def mark(self, key, digest):
+        self.pending[key] = digest
+
+    #---------------------------------------------------------------------------
+    # only call once the archive with the pending posts has been written
+    def save(self):
+        self.exported.update(self.pending)
+        self.pending = dict()
+
+        tmpfile = f'{self.path}.tmp'
+
+        with open(tmpfile, 'w') as fp:
+            json.dump(self.exported, fp, indent=1, sort_keys=True)
+
+        os.replace(tmpfile, self.path)
+
+################################################################################
+# stable key for a post, based on its timestamp - posts sharing a timestamp are
+# numbered in the order they appear in the export
+def fb_post_key(fb_post, seen):
+    key = fb_post_base_key(fb_post)
+
+    count = seen.get(key, 0)
+    seen[key] = count + 1
+
+    if count > 0:
+        key = f'{key}:{count}'
+
+    return key
+
+################################################################################
+def fb_post_base_key(fb_post):
+    if 'timestamp' in fb_post:
+        return f'post:{fb_post["timestamp"]}'
+
+    return f'post:{fb_post_digest(fb_post)}'
+
+################################################################################
+# hash of the post content, used to detect posts that changed between exports
+def fb_post_digest(fb_post):
+    content = json.dumps(fb_post, sort_keys=True, separators=(',', ':'))
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+################################################################################
+# names of the files in an export, matched against the end of their path
+POSTS_FILES = r'(^|/)(your_)?posts(_\d+)?\.json$'
+ALBUM_FILES = r'(^|/)album/\d+\.json$'
+VIDEOS_FILES = r'(^|/)your_videos(_\d+)?\.json$'
+
+################################################################################
+# expand directories and export archives to the your_posts_N.json files they contain
+def find_posts_files(paths):
+    return find_export_files(paths, POSTS_FILES)
+
+################################################################################
+# expand directories and export archives to the files matching the pattern
+def find_export_files(paths, pattern):
+    files = list()
+
+    for path in paths:
+        if os.path.isdir(path):
+            folder = os.path.abspath(path).replace(os.sep, '/')
+
+            names = [
+                name for name in os.listdir(path)
+                if re.search(pattern, f'{folder}/{name}') is not None
+            ]
+
+            files.extend(os.path.join(path, name) for name in sort_export_files(names))
+
+        elif zipfile.is_zipfile(path):
+            names = [
+                name for name in dayone._get_zip_archive(path).namelist()
+                if re.search(pattern, name) is not None
+            ]
+
+            files.extend(dayone.ZipMember(path, name) for name in sort_export_files(names))
+
+        else:
+            files.append(path)
+
+    return files
 
 ################################################################################
-def fb_post_as_entry(fb_post):
-    entry = dayone.Entry()
+# sort numerically, so your_posts_10.json comes after your_posts_9.json
+def sort_export_files(names):
+    return sorted(names, key=lambda name: [
+        int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)
+    ])
+
+################################################################################
+# find a media file from the export in the export archives, falling back to the
+# extracted file when it is not in any of them
+def fb_media_path(uri):
+    for archive in media_archives:
+        member = dayone.ZipMember(archive, uri)
+
+        try:
+            member.info()
+        except KeyError:
+            continue
+
+        return member
+
+    return uri
+
+################################################################################
+# look up a place, using resolved results from the scheduler when available -
+# places that cannot be resolved keep the coordinates from the export
+def lookup_place(query, reverse=False):
+    if geo_scheduler is not None:
+        place = geo_scheduler.lookup(query, reverse=reverse)
+    else:
+        place = dayone.Place.lookup(query, reverse=reverse)
+
+    if place is None:
+        place = query_place(query, reverse=reverse)
+
+    return place
+
+################################################################################
+# a place with only the coordinates of a reverse query
+def query_place(query, reverse=False):
+    place = dayone.Place()
+
+    if reverse is True:
+        place.latitude, place.longitude = query
+
+    return place
+
+################################################################################
+# gather the coordinates that fb_post_as_entry will look up for the given post
+def collect_fb_places(fb_post, scheduler):
+    for coord in fb_post_places(fb_post):
+        scheduler.add(coord, reverse=True)
+
+################################################################################
+def fb_post_places(fb_post):
+    fb_post_data = list()
+
+    if 'data' in fb_post:
+        fb_post_data.extend(fb_post['data'])
+
+    if 'attachments' in fb_post:
+        for attachment in fb_post['attachments']:
+            fb_post_data.extend(attachment['data'])
+
+    # photo locations are only used when the post does not have a place yet
+    has_place = False
+
+    for data in fb_post_data:
+        if 'media' in data:
+            media_meta = data['media'].get('media_metadata', dict())
+            photo_meta = media_meta.get('photo_metadata', dict())
+
+            if 'latitude' in photo_meta and not has_place:
+                yield [photo_meta['latitude'], photo_meta['longitude']]
+                has_place = True
+
+        if 'place' in data and 'coordinate' in data['place']:
+            coord = data['place']['coordinate']
+            yield [coord['latitude'], coord['longitude']]
+            has_place = True
+
+################################################################################
+@dayone.profiled('facebook.post_as_entry')
+def fb_post_as_entry(fb_post, entry_id=None):
+    entry = dayone.Entry(id=entry_id)
 
     if 'tags' in fb_post:
         entry.tags = fb_post['tags']
@@ -50,6 +628,18 @@ def fb_post_as_entry(fb_post):
 
     return entry
 
+################################################################################
+# entry for a photo from an album, or for a video
+def fb_media_as_entry(fb_media, entry_id=None):
+    entry = dayone.Entry(id=entry_id)
+
+    parse_fb_media(fb_media, entry)
+
+    if 'creation_timestamp' in fb_media:
+        entry.timestamp = datetime.fromtimestamp(fb_media['creation_timestamp'], tz=timezone.utc)
+
+    return entry
+
 ################################################################################
 def parse_fb_post_data(fb_post_data, entry):
     # XXX do we want to look for hashtags in the post and add entry tags?
@@ -80,7 +670,7 @@ def parse_fb_media(fb_media, entry):
         return
 
     # posts seem to have redundant information, so let's try to quiet the noise...
-    has_existing_content = entry.body is not None
+    has_existing_content = len(entry.blocks) > 0
 
     uri = fb_media['uri']
     media_meta = fb_media['media_metadata']
@@ -89,9 +679,11 @@ def parse_fb_media(fb_media, entry):
         entry.title = fb_media['title']
 
     if 'photo_metadata' in media_meta:
-        photo = dayone.Photo(fb_media['uri'])
+        # derive the photo id from the entry, so re-imports produce the same ids
+        photo_key = f'{len(entry.photos)}:{uri}'
+        photo = dayone.Photo(fb_media_path(uri), id=uuid.uuid5(entry.id, photo_key))
         entry.photos.append(photo)
-        entry.append(photo.markdown())
+        entry.append(dayone.PhotoBlock(photo))
         parse_fb_photo_metadata(media_meta['photo_metadata'], entry)
 
     # FIXME handle videos properly...
@@ -108,7 +700,7 @@ def parse_fb_photo_metadata(fb_photo_meta, entry):
         lat = fb_photo_meta['latitude']
         lng = fb_photo_meta['longitude']
 
-        entry.place = dayone.Place.lookup([lat, lng], reverse=True)
+        entry.place = lookup_place([lat, lng], reverse=True)
 
 ################################################################################
 def parse_fb_video_metadata(fb_photo_meta, entry):
@@ -121,19 +713,17 @@ def parse_fb_place(fb_place, entry):
         lng = coord['longitude']
         lat = coord['latitude']
 
-        entry.place = dayone.Place.lookup([lat, lng], reverse=True)
+        entry.place = lookup_place([lat, lng], reverse=True)
 
         #TODO set entry timezone
 
-        if entry.place is not None:
-            if 'name' in fb_place:
-                entry.place.name = fb_place['name']
+        if 'name' in fb_place:
+            entry.place.name = fb_place['name']
 
-        entry.append(entry.place.markdown())
+        entry.append(dayone.PlaceBlock(entry.place))
 
     if 'url' in fb_place:
-        text = f'<{fb_place["url"]}>'
-        entry.append(text)
+        entry.append(dayone.LinkBlock(fb_place['url']))
 
     if 'address' in fb_place:
         entry.append(fb_place['address'])
@@ -143,30 +733,80 @@ def parse_fb_external_context(fb_ext, entry):
     if 'url' in fb_ext:
         # TODO generate small previews of external websites
 
-        if 'name' in fb_ext:
-            text = f'[{fb_ext["name"]}]({fb_ext["url"]})'
-        else:
-            text = f'<{fb_ext["url"]}>'
-
-        entry.append(text)
+        entry.append(dayone.LinkBlock(fb_ext['url'], name=fb_ext.get('name')))
 
 ################################################################################
-## MAIN ENTRY
+def main():
+    global geo_scheduler
+
+    argp = argparse.ArgumentParser()
+    argp.add_argument('--posts', nargs='+', help='exported posts data (files, directories or export zips)')
+    argp.add_argument('--media', nargs='+', default=list(), help='export zips that contain media files')
+    argp.add_argument('--photos', nargs='+', help='exported photo album data (files, directories or export zips)')
+    argp.add_argument('--videos', nargs='+', help='exported video data (files, directories or export zips)')
+    argp.add_argument('--jobs', type=int, help='number of processes used to convert the export files')
+    argp.add_argument('--save', default='fb_journal.zip', help='file to write the archive')
+    argp.add_argument('--workers', type=int, help='number of processes used to hash photos')
+    argp.add_argument('--compress', choices=dayone.CompressionPolicy.methods.keys(), help='compression for journal data')
+    argp.add_argument('--config', help='use specified config file', default='dayone.yaml')
+    argp.add_argument('--pipeline', action=argparse.BooleanOptionalAction, default=True, help='overlap reading, geocoding and hashing posts')
+    argp.add_argument('--manifest', help='record of exported posts, only new or changed posts are saved')
+    argp.add_argument('--json', choices=('auto',) + dayone.JsonBackend.names, help='JSON library for export data')
+    argp.add_argument('--profile', action='store_true', help='print the time spent in each stage')
+    argp.add_argument('--profile-stats', help='save cProfile stats to the given file')
+    argp.add_argument('--profile-trace', help='save a Chrome trace of the stages to the given file')
+    args = argp.parse_args()
+
+    dayone.load_config(args.config)
 
-argp = argparse.ArgumentParser()
-argp.add_argument('--posts', help='exported posts data')
-#argp.add_argument('--photos', help='exported photo album data')
-#argp.add_argument('--videos', help='exported video posts')
-args = argp.parse_args()
+    if args.json is not None:
+        dayone.set_json_backend(args.json)
 
-journal = dayone.Journal(name='Facebook Import')
+    stages = dayone.new_profiler(args)
 
-if args.posts is not None:
-    entries = load_posts(args.posts, journal)
+    if stages is not None:
+        stages.start()
 
-archive = dayone.Archive()
-archive.add(journal)
+    journal = dayone.Journal(name='Facebook Import')
 
-# TODO make this an argument
-archive.save('fb_journal.zip')
+    geo_scheduler = dayone.new_geo_scheduler()
+
+    manifest = None
+
+    if args.manifest is not None:
+        manifest = Manifest(args.manifest)
+
+    media_archives.extend(args.media)
+
+    # albums, videos and parallel imports convert whole files at a time
+    if args.photos is not None or args.videos is not None or args.jobs is not None:
+        load_export(
+            journal, posts=args.posts or (), albums=args.photos or (), videos=args.videos or (),
+            manifest=manifest, jobs=args.jobs
+        )
+
+    elif args.posts is not None:
+        load_posts(args.posts, journal, manifest=manifest, pipeline=args.pipeline, workers=args.workers)
+
+    archive = dayone.Archive()
+    archive.workers = args.workers
+    archive.compression = dayone.new_compression_policy(args.compress)
+    archive.add(journal)
+
+    archive.save(args.save)
+
+    if manifest is not None:
+        print(f'exported {len(manifest.pending)} new or changed posts: {args.save}')
+        manifest.save()
+
+    if stages is not None:
+        stages.stop()
+
+        if args.profile:
+            stages.report()
+
+################################################################################
+## MAIN ENTRY
+if __name__ == '__main__':
+    main()
 